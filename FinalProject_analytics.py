@@ -0,0 +1,516 @@
+# FinalProject_analytics.py
+# Correlation statistics for the project questions:
+#   - Does Reddit mention frequency correlate with Spotify's daily ranking?
+#   - Does Reddit mention frequency correlate with Spotify popularity?
+
+import numpy as np
+from FinalProject_data import setup_db, snapshot_date_id
+
+
+def fetch_analysis_arrays(cur):
+    '''
+    Fetches the daily rank, popularity and Reddit mention count of every KaggleData row
+    (one row per song per country) with a single query and returns them as NumPy arrays.
+
+    ARGUMENTS:
+        cur: cursor object
+    RETURNS:
+        arrays (dict): {"country": array of country names, "daily_rank": float array,
+                        "popularity": float array, "mentions": float array}
+    '''
+    cur.execute('''
+        SELECT Country.name, KaggleData.daily_rank, KaggleData.popularity, COALESCE(MentionCount.count, 0)
+        FROM KaggleData
+        JOIN Country ON KaggleData.country_id = Country.id
+        LEFT JOIN MentionCount ON MentionCount.music_id = KaggleData.music_id
+        WHERE KaggleData.daily_rank IS NOT NULL AND KaggleData.popularity IS NOT NULL
+    ''')
+    rows = cur.fetchall()
+
+    if not rows:
+        return {"country": np.array([], dtype=object), "daily_rank": np.array([]),
+                "popularity": np.array([]), "mentions": np.array([])}
+
+    countries, daily_ranks, popularity, mentions = zip(*rows)
+    return {
+        "country": np.array(countries, dtype=object),
+        "daily_rank": np.array(daily_ranks, dtype=float),
+        "popularity": np.array(popularity, dtype=float),
+        "mentions": np.array(mentions, dtype=float),
+    }
+
+
+def fetch_chart_range(cur, start_date, end_date, countries=None):
+    '''
+    Fetches the daily charts between two snapshot dates (inclusive) from ChartHistory as NumPy arrays.
+    ChartHistory is clustered on (date_id, country_id, daily_rank), so this reads one contiguous
+    range of the table instead of scanning it.
+
+    ARGUMENTS:
+        cur: cursor object
+        start_date (str): first snapshot date (e.g. "2025-01-01")
+        end_date (str): last snapshot date (e.g. "2025-12-31")
+        countries (list): optional country codes to keep (e.g. ["US", "CA"])
+    RETURNS:
+        arrays (dict): {"date_id": int array (YYYYMMDD), "country": array of country names,
+                        "daily_rank": int array, "music_id": int array, "popularity": float array}
+    '''
+    sql = '''
+        SELECT ChartHistory.date_id, Country.name, ChartHistory.daily_rank, ChartHistory.music_id,
+               ChartHistory.popularity
+        FROM ChartHistory
+        JOIN Country ON ChartHistory.country_id = Country.id
+        WHERE ChartHistory.date_id BETWEEN ? AND ?
+    '''
+    params = [snapshot_date_id(start_date), snapshot_date_id(end_date)]
+    if countries:
+        sql += f" AND Country.name IN ({', '.join('?' * len(countries))})"
+        params += list(countries)
+    sql += " ORDER BY ChartHistory.date_id, ChartHistory.country_id, ChartHistory.daily_rank"
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+
+    if not rows:
+        return {"date_id": np.array([], dtype=int), "country": np.array([], dtype=object),
+                "daily_rank": np.array([], dtype=int), "music_id": np.array([], dtype=int),
+                "popularity": np.array([])}
+
+    date_ids, country_names, daily_ranks, music_ids, popularity = zip(*rows)
+    return {
+        "date_id": np.array(date_ids, dtype=int),
+        "country": np.array(country_names, dtype=object),
+        "daily_rank": np.array(daily_ranks, dtype=int),
+        "music_id": np.array(music_ids, dtype=int),
+        "popularity": np.array([np.nan if value is None else value for value in popularity], dtype=float),
+    }
+
+
+def fetch_song_trajectory(cur, song_name, start_date=None, end_date=None, country=None):
+    '''
+    Fetches the daily rank and popularity of one song over time (served by the covering
+    idx_chart_history_music index).
+
+    ARGUMENTS:
+        cur: cursor object
+        song_name (str): song name
+        start_date (str): optional first snapshot date
+        end_date (str): optional last snapshot date
+        country (str): optional country code
+    RETURNS:
+        trajectory (list): [(date, country, daily_rank, popularity), ...] ordered by date
+    '''
+    sql = '''
+        SELECT SnapshotDate.date, Country.name, ChartHistory.daily_rank, ChartHistory.popularity
+        FROM Music
+        JOIN ChartHistory ON ChartHistory.music_id = Music.id
+        JOIN SnapshotDate ON ChartHistory.date_id = SnapshotDate.id
+        JOIN Country ON ChartHistory.country_id = Country.id
+        WHERE Music.name = ? AND ChartHistory.date_id BETWEEN ? AND ?
+    '''
+    params = [song_name,
+              snapshot_date_id(start_date) if start_date else 0,
+              snapshot_date_id(end_date) if end_date else 99999999]
+    if country:
+        sql += " AND Country.name = ?"
+        params.append(country)
+    sql += " ORDER BY ChartHistory.date_id, Country.name"
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+
+def rank_rows(values):
+    '''
+    Ranks every row of a 2-D array (average ranks for ties, starting at 1), like
+    scipy.stats.rankdata(values, axis=1), without a Python loop over the rows.
+
+    ARGUMENTS:
+        values (ndarray): 2-D array
+    RETURNS:
+        ranks (ndarray): 2-D float array of the same shape
+    '''
+    n = values.shape[1]
+    order = np.argsort(values, axis=1, kind="mergesort")
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    index = np.broadcast_to(np.arange(n), values.shape)
+
+    # First and last position of the tie group of every sorted value
+    differs = sorted_values[:, 1:] != sorted_values[:, :-1]
+    group_start = np.concatenate([np.ones((values.shape[0], 1), dtype=bool), differs], axis=1)
+    group_end = np.concatenate([differs, np.ones((values.shape[0], 1), dtype=bool)], axis=1)
+    first = np.maximum.accumulate(np.where(group_start, index, 0), axis=1)
+    last = np.minimum.accumulate(np.where(group_end, index, n - 1)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.empty(values.shape, dtype=float)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    return ranks
+
+
+def resample_ranks(groups, n_groups, samples):
+    '''
+    Ranks every row of resampled values (average ranks for ties, like rank_rows() on the resampled
+    values) without sorting: each row counts how often every distinct value was drawn, and the ranks
+    follow from the cumulative counts in value order.
+
+    ARGUMENTS:
+        groups (ndarray): index of every original value among the sorted distinct values
+        n_groups (int): number of distinct values
+        samples (ndarray): 2-D array of indices into the original values (one resample per row)
+    RETURNS:
+        ranks (ndarray): 2-D float array of the same shape as samples
+    '''
+    sample_groups = groups[samples]
+    offsets = np.arange(samples.shape[0])[:, None] * n_groups
+    counts = np.bincount((sample_groups + offsets).ravel(), minlength=samples.shape[0] * n_groups)
+    counts = counts.reshape(samples.shape[0], n_groups)
+    group_ranks = np.cumsum(counts, axis=1) - counts + (counts + 1) / 2
+    return np.take_along_axis(group_ranks, sample_groups, axis=1)
+
+
+def pearson_rows(x, y):
+    '''
+    Pearson correlation of every row of x with the same row of y (NaN for constant rows).
+
+    ARGUMENTS:
+        x (ndarray): 2-D array
+        y (ndarray): 2-D array of the same shape
+    RETURNS:
+        r (ndarray): 1-D array with one coefficient per row
+    '''
+    x_centered = x - x.mean(axis=1, keepdims=True)
+    y_centered = y - y.mean(axis=1, keepdims=True)
+    numerator = (x_centered * y_centered).sum(axis=1)
+    denominator = np.sqrt((x_centered ** 2).sum(axis=1) * (y_centered ** 2).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator
+
+
+def pearson(x, y):
+    '''
+    Pearson correlation coefficient of two 1-D arrays.
+    '''
+    return float(pearson_rows(np.atleast_2d(x), np.atleast_2d(y))[0])
+
+
+def spearman(x, y):
+    '''
+    Spearman rank correlation coefficient of two 1-D arrays (Pearson correlation of the ranks).
+    '''
+    return float(pearson_rows(rank_rows(np.atleast_2d(x)), rank_rows(np.atleast_2d(y)))[0])
+
+
+def masked_pearson_rows(x, y, mask):
+    '''
+    Pearson correlation of every row of x with the same row of y, using only the entries where
+    mask is True (NaN for rows with fewer than 2 such entries or no variance).
+
+    ARGUMENTS:
+        x (ndarray): 2-D array
+        y (ndarray): 2-D array of the same shape
+        mask (ndarray): 2-D bool array of the same shape
+    RETURNS:
+        r (ndarray): 1-D array with one coefficient per row
+    '''
+    counts = mask.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_centered = np.where(mask, x - np.where(mask, x, 0).sum(axis=1, keepdims=True) / counts, 0)
+        y_centered = np.where(mask, y - np.where(mask, y, 0).sum(axis=1, keepdims=True) / counts, 0)
+        numerator = (x_centered * y_centered).sum(axis=1)
+        denominator = np.sqrt((x_centered ** 2).sum(axis=1) * (y_centered ** 2).sum(axis=1))
+        r = numerator / denominator
+    r[counts[:, 0] < 2] = np.nan
+    return r
+
+
+def bootstrap_ci(x, y, method="pearson", n_boot=2000, confidence=0.95, seed=0, max_block_elements=1000000):
+    '''
+    Percentile bootstrap confidence interval of a correlation coefficient. Resamples are drawn in
+    blocks as (block, n) index matrices of at most max_block_elements elements, and the coefficients
+    of a block are computed row-wise, so memory stays bounded however many rows there are. Spearman
+    resamples are ranked with resample_ranks() instead of being sorted.
+
+    ARGUMENTS:
+        x (ndarray): 1-D array
+        y (ndarray): 1-D array
+        method (str): "pearson" or "spearman"
+        n_boot (int): number of bootstrap resamples
+        confidence (float): confidence level of the interval
+        seed (int): random seed
+        max_block_elements (int): memory budget of one block of resamples, in array elements
+    RETURNS:
+        (low, high): the confidence interval (NaN if fewer than 3 values)
+    '''
+    n = len(x)
+    if n < 3:
+        return float("nan"), float("nan")
+
+    if method not in ("pearson", "spearman"):
+        raise ValueError(f"Unknown correlation method: {method}")
+
+    if method == "spearman":
+        x_values, x_groups = np.unique(x, return_inverse=True)
+        y_values, y_groups = np.unique(y, return_inverse=True)
+
+    rng = np.random.default_rng(seed)
+    block_size = max(1, max_block_elements // n)
+    coefficients = np.empty(n_boot)
+    for start in range(0, n_boot, block_size):
+        stop = min(start + block_size, n_boot)
+        samples = rng.integers(0, n, size=(stop - start, n))
+        if method == "spearman":
+            x_samples = resample_ranks(x_groups, len(x_values), samples)
+            y_samples = resample_ranks(y_groups, len(y_values), samples)
+        else:
+            x_samples = x[samples]
+            y_samples = y[samples]
+        coefficients[start:stop] = pearson_rows(x_samples, y_samples)
+    coefficients = coefficients[~np.isnan(coefficients)]
+    if len(coefficients) == 0:
+        return float("nan"), float("nan")
+
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(coefficients, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def correlation_summary(x, y, n_boot=2000, seed=0):
+    '''
+    Pearson and Spearman coefficients of x and y with their bootstrap confidence intervals.
+
+    RETURNS:
+        summary (dict): {"n", "pearson", "pearson_ci", "spearman", "spearman_ci"}
+    '''
+    if len(x) < 3:
+        nan_ci = (float("nan"), float("nan"))
+        return {"n": len(x), "pearson": float("nan"), "pearson_ci": nan_ci,
+                "spearman": float("nan"), "spearman_ci": nan_ci}
+
+    return {
+        "n": len(x),
+        "pearson": pearson(x, y),
+        "pearson_ci": bootstrap_ci(x, y, "pearson", n_boot, seed=seed),
+        "spearman": spearman(x, y),
+        "spearman_ci": bootstrap_ci(x, y, "spearman", n_boot, seed=seed),
+    }
+
+
+def correlation_report(cur, n_boot=2000, seed=0):
+    '''
+    Correlation of Reddit mention counts with Spotify daily rank and with Spotify popularity,
+    over all countries together and per country.
+
+    ARGUMENTS:
+        cur: cursor object
+        n_boot (int): number of bootstrap resamples per confidence interval
+        seed (int): random seed
+    RETURNS:
+        report (dict): {"All": {"daily_rank": summary, "popularity": summary},
+                        "US": {...}, "CA": {...}, ...}  (see correlation_summary())
+    '''
+    arrays = fetch_analysis_arrays(cur)
+
+    report = {"All": {
+        "daily_rank": correlation_summary(arrays["mentions"], arrays["daily_rank"], n_boot, seed),
+        "popularity": correlation_summary(arrays["mentions"], arrays["popularity"], n_boot, seed),
+    }}
+
+    # Split the rows by country once (sorted by country code), then summarize each slice
+    country_names, country_index = np.unique(arrays["country"].astype(str), return_inverse=True)
+    order = np.argsort(country_index, kind="mergesort")
+    boundaries = np.searchsorted(country_index[order], np.arange(len(country_names) + 1))
+    for i, country_name in enumerate(country_names):
+        rows = order[boundaries[i]:boundaries[i + 1]]
+        mentions = arrays["mentions"][rows]
+        report[country_name] = {
+            "daily_rank": correlation_summary(mentions, arrays["daily_rank"][rows], n_boot, seed),
+            "popularity": correlation_summary(mentions, arrays["popularity"][rows], n_boot, seed),
+        }
+
+    return report
+
+
+RANK_MATRIX_QUERY = '''
+    SELECT KaggleData.music_id, Country.name, KaggleData.daily_rank
+    FROM KaggleData
+    JOIN Country ON KaggleData.country_id = Country.id
+    WHERE KaggleData.daily_rank IS NOT NULL
+'''
+
+
+def build_rank_matrix(rows):
+    '''
+    Builds a song x country matrix of daily ranks from (music_id, country name, daily_rank) rows.
+
+    ARGUMENTS:
+        rows (list): rows of RANK_MATRIX_QUERY
+    RETURNS:
+        (countries, music_ids, ranks): sorted country names, sorted music ids and a
+        (len(music_ids), len(countries)) float array with NaN where a song did not chart
+    '''
+    if not rows:
+        return np.array([], dtype=str), np.array([], dtype=int), np.empty((0, 0))
+
+    music_ids, country_names, daily_ranks = zip(*rows)
+    music_ids, music_index = np.unique(np.array(music_ids, dtype=int), return_inverse=True)
+    countries, country_index = np.unique(np.array(country_names, dtype=str), return_inverse=True)
+    ranks = np.full((len(music_ids), len(countries)), np.nan)
+    ranks[music_index, country_index] = daily_ranks
+    return countries, music_ids, ranks
+
+
+def fetch_rank_matrix(cur):
+    '''
+    Fetches the daily ranks of every country with a single query as a song x country matrix
+    (see build_rank_matrix()).
+    '''
+    cur.execute(RANK_MATRIX_QUERY)
+    return build_rank_matrix(cur.fetchall())
+
+
+SIMILARITY_METRICS = ("overlap", "jaccard", "rank_difference", "spearman", "kendall")
+
+
+def country_similarity(ranks, metrics=SIMILARITY_METRICS, max_block_elements=4000000):
+    '''
+    Compares the charts of every pair of countries in a song x country rank matrix. Each country is
+    compared with all others at once on the songs it charted. Countries (and for Kendall's pairwise
+    comparisons, songs) are processed in blocks of at most max_block_elements array elements, so
+    memory stays bounded however many songs a country charted.
+
+    ARGUMENTS:
+        ranks (ndarray): song x country rank matrix (NaN where a song did not chart)
+        metrics (tuple): metrics to compute (Kendall is O(songs^2) per country, so skip it if not needed)
+        max_block_elements (int): memory budget of one block, in array elements
+    RETURNS:
+        similarity (dict): country x country matrices of the requested metrics
+            "overlap": number of songs charted in both countries
+            "jaccard": overlap / number of songs charted in either country
+            "rank_difference": mean absolute rank difference of the common songs
+            "spearman": Spearman correlation of the ranks of the common songs
+            "kendall": Kendall tau-b of the ranks of the common songs
+        Pairs with fewer than 2 common songs have NaN correlations.
+    '''
+    n_countries = ranks.shape[1]
+    present = ~np.isnan(ranks)
+    charted = present.sum(axis=0)
+
+    # Song overlap of every pair in one matrix product
+    overlap = present.T.astype(float) @ present.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        jaccard = overlap / (charted[:, None] + charted[None, :] - overlap)
+    similarity = {"overlap": overlap, "jaccard": jaccard}
+
+    pair_metrics = [metric for metric in ["rank_difference", "spearman", "kendall"] if metric in metrics]
+    for metric in pair_metrics:
+        similarity[metric] = np.full((n_countries, n_countries), np.nan)
+    if not pair_metrics or n_countries == 0:
+        return {metric: similarity[metric] for metric in metrics}
+
+    # Songs of each country, padded to the longest chart: (countries, slots)
+    slots = int(charted.max())
+    song_index = np.argsort(~present, axis=0, kind="mergesort")[:slots].T
+    used_slot = np.arange(slots)[None, :] < charted[:, None]
+
+    block_size = max(1, max_block_elements // max(1, slots * n_countries))
+    for start in range(0, n_countries, block_size):
+        block = np.arange(start, min(start + block_size, n_countries))
+
+        # own[b, s]: rank of song s in country b; other[b, s, c]: rank of the same song in country c
+        other = ranks[song_index[block]]
+        own = other[np.arange(len(block)), :, block]
+        common = used_slot[block][:, :, None] & ~np.isnan(other)
+        own = np.broadcast_to(own[:, :, None], other.shape)
+        other = np.where(common, other, 0)
+        n_common = common.sum(axis=1)
+
+        if "rank_difference" in metrics:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                similarity["rank_difference"][block] = np.where(common, np.abs(own - other), 0).sum(axis=1) / n_common
+
+        # Spearman: re-rank each pair's common songs (others pushed to the end), then masked Pearson
+        if "spearman" in metrics:
+            rows_shape = (len(block) * n_countries, slots)
+            own_rows = np.where(common, own, np.inf).transpose(0, 2, 1).reshape(rows_shape)
+            other_rows = np.where(common, other, np.inf).transpose(0, 2, 1).reshape(rows_shape)
+            mask_rows = common.transpose(0, 2, 1).reshape(rows_shape)
+            similarity["spearman"][block] = masked_pearson_rows(rank_rows(own_rows), rank_rows(other_rows),
+                                                                mask_rows).reshape(len(block), n_countries)
+
+        # Kendall tau-b over every pair of common songs, comparing a chunk of songs with all songs at a time
+        if "kendall" in metrics:
+            concordance = np.zeros((len(block), n_countries))
+            own_pairs = np.zeros((len(block), n_countries))
+            other_pairs = np.zeros((len(block), n_countries))
+            chunk = max(1, max_block_elements // max(1, len(block) * slots * n_countries))
+            for song in range(0, slots, chunk):
+                songs = slice(song, song + chunk)
+                both = common[:, songs, None, :] & common[:, None, :, :]
+                own_sign = np.where(both, np.sign(own[:, songs, None, :] - own[:, None, :, :]), 0)
+                other_sign = np.where(both, np.sign(other[:, songs, None, :] - other[:, None, :, :]), 0)
+                concordance += (own_sign * other_sign).sum(axis=(1, 2))
+                own_pairs += (own_sign ** 2).sum(axis=(1, 2))
+                other_pairs += (other_sign ** 2).sum(axis=(1, 2))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                kendall = concordance / np.sqrt(own_pairs * other_pairs)
+            similarity["kendall"][block] = np.where(n_common < 2, np.nan, kendall)
+
+    return {metric: similarity[metric] for metric in metrics}
+
+
+def most_similar_pairs(countries, matrix, top=10, highest=True):
+    '''
+    Lists the country pairs with the highest (or lowest) values of a similarity matrix.
+
+    ARGUMENTS:
+        countries (ndarray): country names of the matrix rows/columns
+        matrix (ndarray): country x country matrix (see country_similarity())
+        top (int): number of pairs
+        highest (bool): True for the highest values, False for the lowest
+    RETURNS:
+        pairs (list): [(country 1, country 2, value), ...]
+    '''
+    rows, cols = np.triu_indices(len(countries), k=1)
+    values = matrix[rows, cols]
+    keep = ~np.isnan(values)
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+    order = np.argsort(-values if highest else values, kind="mergesort")[:top]
+    return [(str(countries[rows[i]]), str(countries[cols[i]]), float(values[i])) for i in order]
+
+
+def print_report(report):
+    '''
+    Prints the correlation report as a table.
+    '''
+    print(f"{'Country':<8} {'Spotify':<11} {'n':>6} {'Pearson':>8} {'95% CI':>17} {'Spearman':>9} {'95% CI':>17}")
+    for country_name, summaries in report.items():
+        for column, summary in summaries.items():
+            pearson_ci = f"[{summary['pearson_ci'][0]:.3f}, {summary['pearson_ci'][1]:.3f}]"
+            spearman_ci = f"[{summary['spearman_ci'][0]:.3f}, {summary['spearman_ci'][1]:.3f}]"
+            print(f"{country_name:<8} {column:<11} {summary['n']:>6} {summary['pearson']:>8.3f} {pearson_ci:>17} "
+                  f"{summary['spearman']:>9.3f} {spearman_ci:>17}")
+
+
+def main():
+
+    print("===================================================================================")
+    print("SI 206 W25 Final Project")
+    print("Music trend analysis with Kaggle and Reddit API - CORRELATION ANALYSIS")
+    print("===================================================================================\n")
+
+    cur, conn = setup_db("final.db", read_only=True)
+    print("Reddit mention count vs. Spotify daily rank / popularity\n")
+    print_report(correlation_report(cur))
+
+    countries, music_ids, ranks = fetch_rank_matrix(cur)
+    similarity = country_similarity(ranks, metrics=("overlap", "spearman"))
+    print(f"\nMost similar country charts ({len(countries)} countries, Spearman on common songs)\n")
+    country_index = {name: i for i, name in enumerate(countries)}
+    # Pairs sharing only a couple of songs correlate perfectly by chance, so require 10 common songs
+    spearman_matrix = np.where(similarity["overlap"] >= 10, similarity["spearman"], np.nan)
+    for c1, c2, value in most_similar_pairs(countries, spearman_matrix):
+        common = int(similarity["overlap"][country_index[c1], country_index[c2]])
+        print(f"{c1:<4} {c2:<4} {value:>7.3f}  ({common} common songs)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+# FinalProject_benchmark.py
+# Offline benchmarks of the data pipeline with synthetic data:
+#   - a synthetic universal_top_spotify_songs.csv of configurable size (same columns as the Kaggle file)
+#   - a fake Reddit post stream mentioning the synthetic songs
+# Times (and traces the peak memory of) every stage and stores the results as JSON, so that
+# runs at 10k / 1M / 10M rows can be compared against a saved baseline.
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import subprocess
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import FinalProject_data as data
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmark_data")
+BENCHMARK_RESULTS = "benchmark_results.json"
+BENCHMARK_BASELINE = "benchmark_baseline.json"
+BENCHMARK_ROWS = [10000, 1000000, 10000000]
+BENCHMARK_NOISE = {"seconds": 0.05, "peak_mb": 1.0}   # smallest increase reported as a regression
+
+# Import-time budget (seconds) of the entry points. Heavy libraries are imported on first use,
+# so importing a module must not load any of IMPORT_HEAVY_MODULES
+IMPORT_BUDGETS = {"FinalProject_data": 0.2, "FinalProject_visualize": 0.5, "FinalProject_analytics": 0.5}
+IMPORT_HEAVY_MODULES = ["praw", "prawcore", "kagglehub", "pandas", "pyarrow", "matplotlib", "config"]
+
+# Same columns (and order) as the real Kaggle file
+SYNTHETIC_COLUMNS = ["spotify_id", "name", "artists", "daily_rank", "daily_movement", "weekly_movement",
+                     "country", "snapshot_date", "popularity", "is_explicit", "duration_ms", "album_name",
+                     "album_release_date", "danceability", "energy", "key", "loudness", "mode", "speechiness",
+                     "acousticness", "instrumentalness", "valence", "tempo", "time_signature"]
+SYNTHETIC_COUNTRIES = ["AE", "AR", "AT", "AU", "BE", "BG", "BO", "BR", "BY", "CA", "CH", "CL", "CO", "CR", "CZ",
+                       "DE", "DK", "DO", "EC", "EE", "EG", "ES", "FI", "FR", "GB", "GR", "GT", "HK", "HN", "HU",
+                       "ID", "IE", "IL", "IN", "IS", "IT", "JP", "KR", "KZ", "LT", "LU", "LV", "MA", "MX", "MY",
+                       "NG", "NI", "NL", "NO", "NZ", "PA", "PE", "PH", "PK", "PL", "PT", "PY", "RO", "SA", "SE",
+                       "SG", "SK", "SV", "TH", "TR", "TW", "UA", "US", "UY", "VE", "VN", "ZA"]
+SYNTHETIC_CHART_SIZE = 50
+SYNTHETIC_WORDS = ["Love", "Night", "Blue", "Heart", "Fire", "Dream", "Summer", "Rain", "Gold", "Wild",
+                   "Dance", "Light", "Moon", "Sweet", "Lost", "Forever", "Money", "Stars", "Ocean", "Ghost",
+                   "Paradise", "Midnight", "Sunset", "Electric", "Honey", "Velvet", "Silver", "Neon",
+                   "Angel", "Thunder", "Shadow", "Diamond"]
+FAKE_POST_TEMPLATES = ["Thoughts on {}?", "{} has been stuck in my head all week", "Just discovered {}",
+                       "Is {} overrated?", "{} live performance was incredible", "Unpopular opinion about {}"]
+FAKE_POST_FILLERS = ["What are you listening to this week?", "Best albums of the month", "Concert recommendations?",
+                     "Discussion thread", "Underrated artists you love"]
+REDDIT_POSTS_PER_ROW = 0.05   # size of the fake post stream relative to the Kaggle rows
+INSERT_COUNTRIES = ["US", "CA", "GB", "DE", "BR"]   # countries written to the database by the insert stages
+
+
+def synthetic_song_names(n_songs):
+    '''
+    Returns n_songs distinct song names built from SYNTHETIC_WORDS (e.g. "Blue Midnight", "Neon Rain Pt. 2").
+    '''
+    n_words = len(SYNTHETIC_WORDS)
+    names = []
+    for song in range(n_songs):
+        name = f"{SYNTHETIC_WORDS[song % n_words]} {SYNTHETIC_WORDS[(song // n_words) % n_words]}"
+        part = song // (n_words * n_words)
+        names.append(name if part == 0 else f"{name} Pt. {part + 1}")
+    return np.array(names, dtype=object)
+
+
+def generate_kaggle_csv(path, rows, seed=0, chunksize=500000, end_date="2025-04-30"):
+    '''
+    Writes a synthetic universal_top_spotify_songs.csv with the columns of the Kaggle dataset. Rows are
+    daily charts (SYNTHETIC_CHART_SIZE ranks per country and day), newest day first like the real file.
+    Songs are drawn from a skewed distribution that drifts over time, so popular songs chart in many
+    countries and the charts change from day to day.
+
+    ARGUMENTS:
+        path (str): path of the csv file to write
+        rows (int): number of rows
+        seed (int): random seed
+        chunksize (int): rows generated and written at a time
+        end_date (str): snapshot date of the first (newest) day
+    RETURNS:
+        None
+    '''
+    rng = np.random.default_rng(seed)
+    n_songs = max(200, rows // 150)
+    song_names = synthetic_song_names(n_songs)
+    artists = np.array([f"Artist {song % (n_songs // 3 + 1)}" for song in range(n_songs)], dtype=object)
+    albums = np.array([f"Album {song // 10}" for song in range(n_songs)], dtype=object)
+    spotify_ids = np.array([format(song * 2654435761 % 16 ** 22, "022x") for song in range(n_songs)], dtype=object)
+    countries = np.array(SYNTHETIC_COUNTRIES, dtype=object)
+
+    chart_rows = len(SYNTHETIC_COUNTRIES) * SYNTHETIC_CHART_SIZE
+    n_days = rows // chart_rows + 1
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    dates = np.array([(end - timedelta(days)).strftime("%Y-%m-%d") for days in range(n_days)], dtype=object)
+    release_dates = np.array([(end - timedelta(days=int(days))).strftime("%Y-%m-%d")
+                              for days in rng.integers(0, 3650, n_songs)], dtype=object)
+
+    tmp_path = path + ".tmp"
+    for start in range(0, rows, chunksize):
+        index = np.arange(start, min(start + chunksize, rows))
+        n = len(index)
+        day = index // chart_rows
+        rank = index % SYNTHETIC_CHART_SIZE + 1
+        song = ((rng.random(n) ** 3 * n_songs).astype(int) + day * 7) % n_songs
+
+        chunk = pd.DataFrame({
+            "spotify_id": spotify_ids[song],
+            "name": song_names[song],
+            "artists": artists[song],
+            "daily_rank": rank,
+            "daily_movement": rng.integers(-10, 11, n),
+            "weekly_movement": rng.integers(-25, 26, n),
+            "country": countries[(index // SYNTHETIC_CHART_SIZE) % len(countries)],
+            "snapshot_date": dates[day],
+            "popularity": np.clip(100 - rank - rng.integers(0, 30, n), 0, 100),
+            "is_explicit": rng.random(n) < 0.3,
+            "duration_ms": rng.integers(120000, 300000, n),
+            "album_name": albums[song],
+            "album_release_date": release_dates[song],
+            "danceability": rng.random(n),
+            "energy": rng.random(n),
+            "key": rng.integers(0, 12, n),
+            "loudness": rng.uniform(-20, 0, n),
+            "mode": rng.integers(0, 2, n),
+            "speechiness": rng.random(n),
+            "acousticness": rng.random(n),
+            "instrumentalness": rng.random(n) * 0.1,
+            "valence": rng.random(n),
+            "tempo": rng.uniform(60, 200, n),
+            "time_signature": 4,
+        }, columns=SYNTHETIC_COLUMNS)
+        chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False, float_format="%.3f")
+    os.replace(tmp_path, path)
+
+
+def synthetic_dataset(rows, seed=0):
+    '''
+    Returns the directory of the synthetic dataset with the given number of rows, generating it
+    (once) under BENCHMARK_DIR. The directory can be passed as dataset_path to load_kaggle_dataset().
+    '''
+    dataset_path = os.path.join(BENCHMARK_DIR, f"kaggle_{rows}_{seed}")
+    csv_path = os.path.join(dataset_path, data.KAGGLE_FILE)
+    if not os.path.exists(csv_path):
+        os.makedirs(dataset_path, exist_ok=True)
+        print(f"Generating synthetic Kaggle dataset with {rows} rows...")
+        generate_kaggle_csv(csv_path, rows, seed)
+    return dataset_path
+
+
+def generate_posts(song_names, n_posts, seed=0, start_utc=1735689600):
+    '''
+    Generates a fake Reddit post stream. Most posts mention one (sometimes two) of the songs in the
+    title, more often the first (most popular) ones; the rest mention none of them.
+
+    ARGUMENTS:
+        song_names (list): song names the posts can mention
+        n_posts (int): number of posts
+        seed (int): random seed
+        start_utc (float): created_utc of the first post
+    RETURNS:
+        posts (list): [{"id", "title", "selftext", "created_utc", "subreddit", "score"}, ...]
+    '''
+    rng = np.random.default_rng(seed)
+    subreddits = data.REDDIT_SUBREDDITS.split("+")
+    kinds = rng.random(n_posts)
+    songs = (rng.random((n_posts, 2)) ** 2 * len(song_names)).astype(int)
+    templates = rng.integers(0, len(FAKE_POST_TEMPLATES), n_posts)
+    scores = rng.integers(0, 5000, n_posts)
+
+    posts = []
+    for i in range(n_posts):
+        if kinds[i] < 0.6:
+            title = FAKE_POST_TEMPLATES[templates[i]].format(song_names[songs[i, 0]])
+        elif kinds[i] < 0.7:
+            title = f"{song_names[songs[i, 0]]} vs {song_names[songs[i, 1]]}"
+        else:
+            title = FAKE_POST_FILLERS[templates[i] % len(FAKE_POST_FILLERS)]
+        posts.append({
+            "id": np.base_repr(1000000 + i, 36).lower(),
+            "title": title,
+            "selftext": "",
+            "created_utc": float(start_utc + i * 30),
+            "subreddit": subreddits[i % len(subreddits)],
+            "score": int(scores[i]),
+        })
+    return posts
+
+
+class FakeRedditClient:
+    '''
+    Offline stand-in for praw.Reddit: every search returns the same prepared post stream
+    (up to `limit` posts), so group_search() runs its matching loop without the network.
+    '''
+
+    def __init__(self, posts):
+        self.posts = [SimpleNamespace(**post) for post in posts]
+        self.auth = SimpleNamespace(limits={})
+
+    def subreddit(self, name):
+        return self
+
+    def search(self, query, sort="top", time_filter="month", limit=100, **kwargs):
+        return iter(self.posts[:limit])
+
+
+def measure_import(module, runs=5):
+    '''
+    Measures the cold import time of a module in fresh Python processes (the fastest of `runs`)
+    and lists the heavy modules the import loaded.
+
+    ARGUMENTS:
+        module (str): module name, e.g. "FinalProject_visualize"
+        runs (int): number of fresh processes
+    RETURNS:
+        result (dict): {"seconds", "budget", "heavy_modules"}
+    '''
+    code = (f"import sys, time, json\n"
+            f"start_time = time.perf_counter()\n"
+            f"import {module}\n"
+            f"seconds = time.perf_counter() - start_time\n"
+            f"print(json.dumps([seconds, [name for name in {IMPORT_HEAVY_MODULES!r} if name in sys.modules]]))")
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+
+    best = None
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=current_directory, capture_output=True,
+                                text=True, check=True).stdout
+        seconds, heavy_modules = json.loads(output.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return {"seconds": round(best, 4), "budget": IMPORT_BUDGETS.get(module), "heavy_modules": heavy_modules}
+
+
+def check_import_budgets(imports):
+    '''
+    Lists the modules whose import is over budget or loads heavy modules.
+
+    ARGUMENTS:
+        imports (dict): {module: result of measure_import()}
+    RETURNS:
+        failures (list): [(module, reason), ...]
+    '''
+    failures = []
+    for module, result in imports.items():
+        if result["budget"] is not None and result["seconds"] > result["budget"]:
+            failures.append((module, f"{result['seconds']:.3f} s > budget {result['budget']:.3f} s"))
+        if result["heavy_modules"]:
+            failures.append((module, "imports " + ", ".join(result["heavy_modules"])))
+    return failures
+
+
+def measure(setup, run, trace_memory=True, repeat=1):
+    '''
+    Times one benchmark stage (the best of `repeat` runs), and if trace_memory is True runs it once more
+    (on a fresh setup) under tracemalloc to record its peak memory. Tracing slows Python code down,
+    so the two are measured in separate runs.
+
+    ARGUMENTS:
+        setup (function): returns the state of one run (not timed); a "conn" in it is closed afterwards
+        run (function): run(state) runs the stage and returns the number of rows it processed
+        trace_memory (bool): whether to measure the peak memory
+        repeat (int): number of timed runs
+    RETURNS:
+        result (dict): {"rows", "seconds", "rows_per_second", "peak_mb"}
+    '''
+    def run_once(traced):
+        state = setup()
+        try:
+            if traced:
+                tracemalloc.start()
+            start_time = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                rows = run(state)
+            seconds = time.perf_counter() - start_time
+            peak = tracemalloc.get_traced_memory()[1] if traced else None
+        finally:
+            if traced:
+                tracemalloc.stop()
+            if state.get("conn") is not None:
+                state["conn"].close()
+        return rows, seconds, peak
+
+    rows, seconds, _ = run_once(False)
+    for _ in range(repeat - 1):
+        seconds = min(seconds, run_once(False)[1])
+    peak = run_once(True)[2] if trace_memory else None
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+        "peak_mb": round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+
+
+def new_db(work_dir, name, template=None):
+    '''
+    Opens a fresh benchmark database in work_dir (a copy of template if given) and returns
+    {"cur": cursor, "conn": connection}.
+    '''
+    db_path = os.path.join(work_dir, name)
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    if template is not None:
+        source = sqlite3.connect(template)
+        target = sqlite3.connect(db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+    cur, conn = data.setup_db(db_path)
+    return {"cur": cur, "conn": conn}
+
+
+def benchmark_size(rows, work_dir, seed=0, trace_memory=True, repeat=1, country="US"):
+    '''
+    Runs every benchmark stage on the synthetic dataset with the given number of rows.
+
+    ARGUMENTS:
+        rows (int): number of rows of the synthetic Kaggle dataset
+        work_dir (str): directory for the benchmark databases and output files
+        seed (int): random seed of the synthetic data
+        trace_memory (bool): whether to measure the peak memory of each stage
+        repeat (int): number of timed runs of each stage (the fastest is kept)
+        country (str): country loaded by the load_kaggle_dataset stages
+    RETURNS:
+        results (dict): {stage name: result of measure()}
+    '''
+    # The charts are drawn with the non-interactive backend. pyplot is imported here, so that its
+    # import time is not counted in the first chart
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+    import FinalProject_visualize as visualize
+
+    dataset_path = synthetic_dataset(rows, seed)
+    results = {}
+
+    def report(stage, result):
+        results[stage] = result
+        peak = f"{result['peak_mb']:>9.1f} MB" if result["peak_mb"] is not None else ""
+        print(f"  {stage:<50} {result['rows']:>9} rows {result['seconds']:>9.3f} s {peak}")
+
+    print(f"\n{rows} rows")
+
+    # Kaggle loading: csv scan, and the Parquet cache if pyarrow is installed (in a private cache directory)
+    criteria = {"country": country}
+    report("load_kaggle_dataset (csv)", measure(
+        lambda: {},
+        lambda state: len(data.load_kaggle_dataset(criteria, dataset_path=dataset_path, use_cache=False)),
+        trace_memory, repeat))
+    report("load_kaggle_countries (csv)", measure(
+        lambda: {},
+        lambda state: sum(len(records) for records in data.load_kaggle_countries(
+            INSERT_COUNTRIES, dataset_path=dataset_path, use_cache=False).values()),
+        trace_memory, repeat))
+
+    if data.load_pyarrow()[1] is not None:
+        cache_dir = os.path.join(work_dir, "kaggle_cache")
+        saved_cache_dir = data.KAGGLE_CACHE_DIR
+        data.KAGGLE_CACHE_DIR = cache_dir
+        try:
+            report("load_kaggle_dataset (parquet cache, cold)", measure(
+                lambda: shutil.rmtree(cache_dir, ignore_errors=True) or {},
+                lambda state: len(data.load_kaggle_dataset(criteria, dataset_path=dataset_path)),
+                trace_memory, repeat))
+            report("load_kaggle_dataset (parquet cache, warm)", measure(
+                lambda: {},
+                lambda state: len(data.load_kaggle_dataset(criteria, dataset_path=dataset_path)),
+                trace_memory, repeat))
+        finally:
+            data.KAGGLE_CACHE_DIR = saved_cache_dir
+
+    # Records written by the database stages (loaded once, not timed)
+    records = []
+    for chunk in data.stream_kaggle_dataset({"country": INSERT_COUNTRIES}, use_cache=False, dataset_path=dataset_path):
+        records.extend(data.iter_kaggle_records(chunk))
+
+    def insert_kaggle(state):
+        data.create_update_kaggle_db(state["cur"], state["conn"], records, limit=None)
+        return len(records)
+
+    def bulk_insert_kaggle(state):
+        data.bulk_update_kaggle_db(state["cur"], state["conn"], records)
+        return len(records)
+
+    def fresh_db():
+        return new_db(work_dir, "kaggle.db")
+
+    report("create_update_kaggle_db", measure(fresh_db, insert_kaggle, trace_memory, repeat))
+    report("bulk_update_kaggle_db", measure(fresh_db, bulk_insert_kaggle, trace_memory, repeat))
+    kaggle_db = os.path.join(work_dir, "kaggle.db")
+
+    # Reddit search: the group_search matching loop over the fake post stream
+    song_names = sorted({record["name"] for record in records})
+    posts = generate_posts(song_names, max(1000, int(rows * REDDIT_POSTS_PER_ROW)), seed)
+    client = FakeRedditClient(posts)
+    matcher = data.SongMatcher(song_names)
+    def match_posts(state):
+        data.group_search(song_names, len(posts), client=client, matcher=matcher)
+        return len(posts)
+
+    report("group_search (matching loop)", measure(lambda: {}, match_posts, trace_memory, repeat))
+
+    posts_by_song = data.group_search(song_names, len(posts), client=client, matcher=matcher)
+
+    def insert_reddit(state):
+        data.create_update_reddit_db(state["cur"], state["conn"], posts_by_song, limit=None)
+        return sum(len(song_posts) for song_posts in posts_by_song.values())
+
+    report("create_update_reddit_db", measure(lambda: new_db(work_dir, "reddit.db", template=kaggle_db),
+                                              insert_reddit, trace_memory, repeat))
+    full_db = os.path.join(work_dir, "reddit.db")
+    with sqlite3.connect(full_db) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # Visualizer queries (with an empty query cache, so every run executes its SQL)
+    def open_visualizer_db():
+        visualize.query_cache["results"] = {}
+        visualize.query_cache["connection"] = None
+        cur, conn = data.setup_db(full_db, read_only=True)
+        return {"cur": cur, "conn": conn}
+
+    def export_counts(state):
+        visualize.count_reddit_posts(state["cur"], os.path.join(work_dir, "reddit_post_counts.csv"))
+        return len(song_names)
+
+    report("count_reddit_posts", measure(open_visualizer_db, export_counts, trace_memory, repeat))
+
+    # Every chart is drawn headless and saved as png (one "row" per chart)
+    def draw_chart(visualize_function):
+        def run(state):
+            visualize_function(state["cur"])
+            return 1
+        return run
+
+    visualize.render_settings["output_dir"] = work_dir
+    visualize.render_settings["formats"] = ("png",)
+    try:
+        for chart_name, (visualize_function, tables) in visualize.CHARTS.items():
+            report(f"visualize: {chart_name}",
+                   measure(open_visualizer_db, draw_chart(visualize_function), trace_memory, repeat))
+    finally:
+        visualize.render_settings["output_dir"] = None
+
+    return results
+
+
+def environment_info():
+    '''
+    Returns the versions that benchmark results depend on.
+    '''
+    pa = data.load_pyarrow()[0]
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__ if pa is not None else None,
+    }
+
+
+def compare_results(results, baseline, tolerance=0.25, min_difference=BENCHMARK_NOISE):
+    '''
+    Compares benchmark results with a baseline (same JSON format) and lists the stages that got slower
+    or use more memory than the baseline by more than the tolerance. Differences below min_difference
+    (timer noise of very short stages) are ignored.
+
+    ARGUMENTS:
+        results (dict): results of run_benchmarks()
+        baseline (dict): saved results of an earlier run
+        tolerance (float): allowed relative increase (0.25 = 25%)
+        min_difference (dict): smallest absolute increase reported, per metric
+    RETURNS:
+        regressions (list): [(rows, stage, metric, baseline value, new value), ...]
+    '''
+    regressions = []
+    for rows, stages in results["sizes"].items():
+        baseline_stages = baseline.get("sizes", {}).get(rows, {})
+        for stage, result in stages.items():
+            if stage not in baseline_stages:
+                continue
+            for metric in ["seconds", "peak_mb"]:
+                old_value = baseline_stages[stage].get(metric)
+                new_value = result.get(metric)
+                if old_value is None or new_value is None:
+                    continue
+                if new_value > old_value * (1 + tolerance) and new_value - old_value >= min_difference[metric]:
+                    regressions.append((rows, stage, metric, old_value, new_value))
+    return regressions
+
+
+def run_benchmarks(sizes=BENCHMARK_ROWS, seed=0, trace_memory=True, repeat=1):
+    '''
+    Runs the benchmarks for every dataset size in a temporary directory.
+
+    RETURNS:
+        results (dict): {"created": ..., "environment": {...}, "imports": {module: result of measure_import()},
+                         "sizes": {"10000": {stage: result}, ...}}
+    '''
+    results = {"created": datetime.now().isoformat(timespec="seconds"), "environment": environment_info(),
+               "imports": {}, "sizes": {}}
+
+    print("Import time")
+    for module in IMPORT_BUDGETS:
+        results["imports"][module] = measure_import(module)
+        print(f"  {module:<50} {results['imports'][module]['seconds']:>9.3f} s "
+              f"(budget {results['imports'][module]['budget']:.3f} s)")
+
+    for rows in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"benchmark_{rows}_")
+        try:
+            results["sizes"][str(rows)] = benchmark_size(rows, work_dir, seed, trace_memory, repeat)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Offline benchmarks with synthetic Kaggle and Reddit data")
+    parser.add_argument("--rows", type=int, nargs="+", default=BENCHMARK_ROWS, help="synthetic dataset sizes")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic data")
+    parser.add_argument("--imports-only", action="store_true", help="only measure the import times")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage (the fastest is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slower) peak memory runs")
+    parser.add_argument("--out", default=BENCHMARK_RESULTS, help="JSON file for the results")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE, help="JSON baseline to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks([] if args.imports_only else args.rows, args.seed, not args.no_memory, args.repeat)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    failures = check_import_budgets(results["imports"])
+    print(f"\n{len(failures)} import budget failure(s)")
+    for module, reason in failures:
+        print(f"  {module:<50} {reason}")
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        print(f"\n{len(regressions)} regression(s) compared with {args.baseline}")
+        for rows, stage, metric, old_value, new_value in regressions:
+            print(f"  {rows:>9} rows  {stage:<50} {metric:<8} {old_value:>10} -> {new_value:>10}")
+    else:
+        baseline = {"sizes": {}}
+
+    if args.save_baseline:
+        # Sizes that were not run this time keep their previous baseline
+        baseline["created"] = results["created"]
+        baseline["environment"] = results["environment"]
+        baseline.setdefault("sizes", {}).update(results["sizes"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,110 +28,453 @@ Visualization Tools:
 
 
 import os
+import sys
+import argparse
 import sqlite3
-import json
+import hashlib
+import urllib.parse
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+import json
 import time
-import config
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# The APIs (praw, kagglehub) and pandas/pyarrow are imported on first use, so that importing this module
+# (e.g. FinalProject_visualize.py only needs setup_db()) is fast and does not need config.py
+
+# Reddit clients are created on first use, one per thread (see get_reddit_client()): a praw.Reddit
+# instance shares one HTTP session, rate limiter state and token refresh, so it is not thread-safe.
+# A client set with set_reddit_client() is shared by every thread instead.
+reddit_client = None
+reddit_client_generation = 0    # incremented by set_reddit_client(), so threads drop their old clients
+reddit_thread_clients = threading.local()
+reddit_client_lock = threading.Lock()
+
+
+def get_reddit_client():
+    '''
+    Returns the Reddit client of the calling thread, creating it on first use from the credentials
+    in config.py (using OAuth to increase rate limit). Search worker threads each get their own client;
+    requests of all of them are still paced by the shared TokenBucket.
+
+    RETURNS:
+        client: praw.Reddit object (or the client set with set_reddit_client())
+    '''
+    with reddit_client_lock:
+        if reddit_client is not None:
+            return reddit_client
+        generation = reddit_client_generation
+
+    if getattr(reddit_thread_clients, "generation", None) != generation:
+        import config
+        import praw
+        reddit_thread_clients.client = praw.Reddit(
+            client_id=config.REDDIT_CLIENT_ID,
+            client_secret=config.REDDIT_CLIENT_SECRET,
+            user_agent=config.REDDIT_USER_AGENT
+        )
+        reddit_thread_clients.generation = generation
+    return reddit_thread_clients.client
+
+
+def set_reddit_client(client):
+    '''
+    Replaces the Reddit client used when no client is passed (e.g. a stub with the same interface
+    for offline runs), for every thread. set_reddit_client(None) makes the next get_reddit_client()
+    call of each thread create a new one.
+    '''
+    global reddit_client, reddit_client_generation
+    with reddit_client_lock:
+        reddit_client = client
+        reddit_client_generation += 1
+
+
+def load_pyarrow():
+    '''
+    Imports pyarrow on first use. pyarrow is optional: it enables the local Parquet cache of the Kaggle dataset.
+
+    RETURNS:
+        (pa, pq): the pyarrow and pyarrow.parquet modules, or (None, None) if pyarrow is not installed
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, None
+    return pa, pq
+
+
+KAGGLE_DATASET = "asaniczka/top-spotify-songs-in-73-countries-daily-updated"
+KAGGLE_FILE = "universal_top_spotify_songs.csv"
+KAGGLE_COLUMNS = ["name", "artists", "daily_rank", "country", "snapshot_date", "popularity"]
+# Fixed dtypes so that every chunk (and the columnar cache) has the same schema.
+# snapshot_date is kept as a string so that e.g. "2025-04-01" matches without date parsing
+KAGGLE_DTYPES = {
+    "name": str,
+    "artists": str,
+    "country": str,
+    "snapshot_date": str,
+    "daily_rank": "Int64",
+    "popularity": "Int64"
+}
+KAGGLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".kaggle_cache")
+
+
+def kaggle_dataset_version(dataset_path):
+    '''
+    Returns the version of the downloaded Kaggle dataset. kagglehub stores each dataset version
+    in a ".../versions/<number>" directory; if the path does not follow that layout, the size and
+    modification time of the csv file are used instead.
+
+    ARGUMENTS:
+        dataset_path (str): directory returned by kagglehub.dataset_download()
+    RETURNS:
+        version (str): e.g. "v1042" or "1735689600-245120347"
+    '''
+    if os.path.basename(os.path.dirname(dataset_path)) == "versions":
+        return "v" + os.path.basename(dataset_path)
+
+    stat = os.stat(os.path.join(dataset_path, KAGGLE_FILE))
+    return f"{int(stat.st_mtime)}-{stat.st_size}"
+
 
-# APIs
-import praw
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
+def kaggle_cache_path(version, columns=KAGGLE_COLUMNS):
+    '''
+    Returns the path of the Parquet cache file for a dataset version and column projection.
+
+    ARGUMENTS:
+        version (str): dataset version returned by kaggle_dataset_version()
+        columns (list): columns kept in the cache (the usecols projection)
+    RETURNS:
+        path (str): path of the cache file in KAGGLE_CACHE_DIR
+    '''
+    projection = hashlib.sha1(",".join(sorted(columns)).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(KAGGLE_CACHE_DIR, f"{os.path.splitext(KAGGLE_FILE)[0]}_{version}_{projection}.parquet")
+
+
+def build_kaggle_cache(csv_path, cache_path, columns=KAGGLE_COLUMNS, chunksize=50000):
+    '''
+    Converts the Kaggle csv file into a Parquet cache file, one row group per csv chunk, so the
+    conversion itself never holds the whole dataset in memory. Cache files of older dataset versions
+    are removed once the new file is complete.
+
+    ARGUMENTS:
+        csv_path (str): path of the downloaded csv file
+        cache_path (str): path of the Parquet file to write (from kaggle_cache_path())
+        columns (list): columns to keep
+        chunksize (int): Number of csv rows to parse at a time
+    RETURNS:
+        None
+    '''
+    import pandas as pd
+    pa, pq = load_pyarrow()
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    dtypes = {key: KAGGLE_DTYPES[key] for key in columns if key in KAGGLE_DTYPES}
+
+    # Write into a temporary file first so an interrupted run never leaves a broken cache behind
+    tmp_path = cache_path + ".tmp"
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_path, usecols=columns, dtype=dtypes, chunksize=chunksize):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, cache_path)
+
+    # Invalidate the cache files of other dataset versions (same projection)
+    prefix = os.path.splitext(KAGGLE_FILE)[0] + "_"
+    projection_suffix = "_" + cache_path.rsplit("_", 1)[1]
+    for filename in os.listdir(os.path.dirname(cache_path)):
+        old_path = os.path.join(os.path.dirname(cache_path), filename)
+        if filename.startswith(prefix) and filename.endswith(projection_suffix) and old_path != cache_path:
+            os.remove(old_path)
+
+
+def filter_kaggle_chunk(chunk, criteria):
+    '''
+    Keeps only the rows of a dataframe chunk matching every criteria key.
+
+    ARGUMENTS:
+        chunk (DataFrame): a chunk of the Kaggle dataset
+        criteria (dict): see stream_kaggle_dataset()
+    RETURNS:
+        filtered_chunk (DataFrame): the matching rows
+    '''
+    mask = None
+    for criteria_key, criteria_val in criteria.items():
+        if isinstance(criteria_val, (list, set, tuple)):
+            key_mask = chunk[criteria_key].isin(criteria_val)
+        else:
+            key_mask = chunk[criteria_key] == criteria_val
+        mask = key_mask if mask is None else (mask & key_mask)
+
+    return chunk if mask is None else chunk.loc[mask]
+
+
+def stream_kaggle_dataset(criteria, chunksize=50000, use_cache=True, dataset_path=None):
+    '''
+    Reads the Kaggle dataset csv file in chunks and applies the criteria to each chunk while
+    reading, so only the matching rows are kept in memory. Peak memory depends on the chunksize,
+    not on the size of the whole dataset.
 
-# Using OAuth to increase rate limit
-reddit = praw.Reddit(
-    client_id=config.REDDIT_CLIENT_ID,
-    client_secret=config.REDDIT_CLIENT_SECRET,
-    user_agent=config.REDDIT_USER_AGENT
-)
+    If pyarrow is installed, the csv file is converted once per dataset version into a local Parquet
+    cache (see build_kaggle_cache()) and later runs read the cache with the criteria pushed down
+    to the Parquet reader instead of reparsing the csv file. The cache is also read in record batches,
+    so its chunks hold at most chunksize matching rows as well.
 
-def load_kaggle_dataset(criteria, option="1"):
+    ARGUMENTS:
+        criteria (dict): Argument that decides what data to keep (e.g. {"country": "US", "snapshot_date": "2025-04-01"}).
+                         A list/set/tuple value keeps the rows matching any of its values (e.g. {"country": ["US", "CA"]})
+        chunksize (int): Number of csv rows to parse at a time
+        use_cache (bool): Whether to use (and build) the Parquet cache
+        dataset_path (str): Optional local directory containing KAGGLE_FILE (e.g. a synthetic dataset
+                            from FinalProject_benchmark.py). Skips the download.
+    RETURNS:
+        generator: yields filtered dataframe chunks (only chunks with at least one matching row)
+    '''
+
+    import pandas as pd
+
+    # Download (or reuse the locally cached copy of) the dataset and read the csv file directly
+    if dataset_path is None:
+        import kagglehub
+        dataset_path = kagglehub.dataset_download(KAGGLE_DATASET)
+    csv_path = os.path.join(dataset_path, KAGGLE_FILE)
+
+    pa, pq = load_pyarrow()
+    if use_cache and pq is not None:
+        import pyarrow.dataset as ds
+
+        cache_path = kaggle_cache_path(kaggle_dataset_version(dataset_path))
+        if not os.path.exists(cache_path):
+            build_kaggle_cache(csv_path, cache_path, chunksize=chunksize)
+
+        row_filter = None
+        for criteria_key, criteria_val in criteria.items():
+            if isinstance(criteria_val, (list, set, tuple)):
+                key_filter = ds.field(criteria_key).isin(list(criteria_val))
+            else:
+                key_filter = ds.field(criteria_key) == criteria_val
+            row_filter = key_filter if row_filter is None else (row_filter & key_filter)
+
+        # Row groups that cannot match are skipped. The filtered batches (often much smaller than a
+        # row group) are collected up to chunksize rows and converted to one dataframe
+        batches = []
+        batch_rows = 0
+        dataset = ds.dataset(cache_path, format="parquet")
+        for batch in dataset.to_batches(columns=KAGGLE_COLUMNS, filter=row_filter, batch_size=chunksize):
+            if batch.num_rows == 0:
+                continue
+            if batch_rows + batch.num_rows > chunksize:
+                yield pa.Table.from_batches(batches).to_pandas()
+                batches, batch_rows = [], 0
+            batches.append(batch)
+            batch_rows += batch.num_rows
+        if batches:
+            yield pa.Table.from_batches(batches).to_pandas()
+        return
+
+    for chunk in pd.read_csv(csv_path, usecols=KAGGLE_COLUMNS, dtype=KAGGLE_DTYPES, chunksize=chunksize):
+        filtered_chunk = filter_kaggle_chunk(chunk, criteria)
+        if len(filtered_chunk) > 0:
+            yield filtered_chunk
+
+
+def iter_kaggle_records(df):
+    '''
+    Yields the rows of a (filtered) Kaggle dataframe as record dictionaries built directly from
+    the dataframe columns, in the same format as to_json(orient='records') followed by json.loads(),
+    without serializing the dataframe to a JSON string first. Missing values become None.
+
+    ARGUMENTS:
+        df (DataFrame): a (filtered) chunk of the Kaggle dataset
+    RETURNS:
+        generator: yields {"name": ..., "artists": ..., "daily_rank": ..., ...} dictionaries
+    '''
+    columns = list(df.columns)
+    column_values = []
+    for column in columns:
+        values = df[column].astype(object)
+        column_values.append(values.where(values.notna(), None).tolist())
+
+    for row in zip(*column_values):
+        yield dict(zip(columns, row))
+
+
+def load_kaggle_dataset(criteria, option="1", dataset_path=None, use_cache=True):
     '''
     Loads kaggle dataset (Top Spotify Songs in 73 Countries (Daily Updated)) using Kaggle public API.
     Saves the dataset in the current directory as a .json file, or stores it as a python object 
-    depending on user choice.
+    depending on user choice. The csv file is streamed in chunks with stream_kaggle_dataset(), so
+    only the rows matching the criteria are ever kept in memory.
 
     ARGUMENTS:
         option (str): An optional argument that indicates the loading/saving option.
         criteria (dict): Argument that decides what data to keep (e.g. {"country": "US", "data_start": "2025-04-01"})
+        dataset_path (str): Optional local directory containing the csv file (see stream_kaggle_dataset())
+        use_cache (bool): Whether to use the Parquet cache (see stream_kaggle_dataset())
 
     RETURNS:
         json_object: A dataset in json format returned with option=1. 
         None: Returned with option=2. json file saved in current directory
     '''
 
+    import pandas as pd
+
     current_directory = os.path.dirname(os.path.abspath(__file__))
 
-    # Load Kaggle dataset into dataframe python object
-    df = kagglehub.dataset_load(
-        KaggleDatasetAdapter.PANDAS,
-        "asaniczka/top-spotify-songs-in-73-countries-daily-updated",
-        "universal_top_spotify_songs.csv",
-        pandas_kwargs={"usecols": ["name", "artists", "daily_rank", "country", "snapshot_date", "popularity"]}
-    )
+    # Stream the Kaggle dataset and keep only the filtered chunks
+    try:
+        chunks = list(stream_kaggle_dataset(criteria, use_cache=use_cache, dataset_path=dataset_path))
+    except (OSError, ValueError) as e:
+        print(f"Failed to load dataset. ({e})\n")
+        return None
 
-    if df is not None:
+    print("Dataset loaded successfully.\n")
 
-        print("Dataset loaded successfully.\n")
+    if chunks:
+        filtered_df = pd.concat(chunks, ignore_index=True)
+    else:
+        filtered_df = pd.DataFrame(columns=KAGGLE_COLUMNS)
 
-        # Filter the dataframe based on criteria
-        filtered_df = df
-        for criteria_key, criteria_val in criteria.items():
-            filtered_df = filtered_df.loc[(filtered_df[criteria_key] == criteria_val)]
-
-        # TESTING - display whole dataset
-        print(filtered_df)
-        print()
-
-        # Option 1: Convert the dataset to JSON (for project's purpose) format and keep as a python object
-        if option == "1":
-            print("Option 1 (default): Saving dataset as json format python object")
-            json_string = filtered_df.to_json(orient='records', lines=False)
-            json_object = json.loads(json_string)
-
-            return json_object
-
-        # Option 2: Convert the dataset to JSON format (for project's purpose) and save it in the current directory.
-        #           For testing and viewing data contents
-        elif option == "2":
-            filtered_df.to_json(os.path.join(current_directory, 'universal_top_spotify_songs.json'), 
-                    orient='records', 
-                    lines=False)
-            
+    # TESTING - display whole dataset
+    print(filtered_df)
+    print()
+
+    # Option 1: Convert the dataset to JSON (for project's purpose) format and keep as a python object
+    if option == "1":
+        print("Option 1 (default): Saving dataset as json format python object")
+        json_object = list(iter_kaggle_records(filtered_df))
+
+        return json_object
+
+    # Option 2: Convert the dataset to JSON format (for project's purpose) and save it in the current directory.
+    #           For testing and viewing data contents
+    elif option == "2":
+        filtered_df.to_json(os.path.join(current_directory, 'universal_top_spotify_songs.json'), 
+                orient='records', 
+                lines=False)
+
+
+def load_kaggle_countries(countries, snapshot_date=None, dataset_path=None, use_cache=True):
+    '''
+    Loads the rows of many countries from the Kaggle dataset with a single scan of the csv file.
+    Matching rows are partitioned by country while the file is being read, so loading N countries
+    costs one parse instead of N calls to load_kaggle_dataset().
+
+    ARGUMENTS:
+        countries (list): ISO 3166-1 alpha-2 country codes to keep (e.g. ["US", "CA"])
+        snapshot_date (str or list): Optional date (or list of dates) to keep (e.g. "2025-04-01")
+        dataset_path (str): Optional local directory containing the csv file (see stream_kaggle_dataset())
+        use_cache (bool): Whether to use the Parquet cache (see stream_kaggle_dataset())
+    RETURNS:
+        country_records (dict): {"US": [{record1}, {record2}, ...], "CA": [...], ...} in the same
+        record format as load_kaggle_dataset() option 1. Countries without rows map to an empty list.
+    '''
+
+    criteria = {"country": list(countries)}
+    if snapshot_date is not None:
+        criteria["snapshot_date"] = snapshot_date
+
+    country_records = {}
+    for country in countries:
+        country_records[country] = []
+
+    for chunk in stream_kaggle_dataset(criteria, use_cache=use_cache, dataset_path=dataset_path):
+        for country, country_df in chunk.groupby("country", sort=False):
+            country_records[country].extend(iter_kaggle_records(country_df))
+
+    return country_records
+
+
+# SQLite tuning applied to every connection (see connect_db())
+DB_CACHE_SIZE_KB = 65536            # page cache: 64 MB
+DB_MMAP_SIZE = 256 * 1024 * 1024    # memory-mapped I/O: 256 MB
+DB_CACHED_STATEMENTS = 512          # prepared statement cache per connection
+DB_BUSY_TIMEOUT = 30                # seconds to wait for a lock before "database is locked"
+
+
+def connect_db(db_path, read_only=False):
+    '''
+    Connection factory for the SQLite database. Write connections switch the database to WAL
+    journaling with synchronous=NORMAL, so readers keep reading a consistent snapshot while the
+    ingester commits. Read-only connections are opened with a "mode=ro" URI and cannot write.
+    Both use a larger page cache, memory-mapped I/O and a larger statement cache.
+
+    ARGUMENTS:
+        db_path (str): path of the database file
+        read_only (bool): whether to open a read-only connection
+    RETURNS:
+        conn: connection object
+    '''
+    if read_only:
+        uri = "file:" + urllib.parse.quote(os.path.abspath(db_path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
     else:
-        print("Failed to load dataset.\n")
+        conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    return conn
 
 
-def setup_db(db_name):
+def setup_db(db_name, read_only=False):
     '''
     Sets up and connects to the SQLite database in local directory and returns
-    cursor and connection objects.
+    cursor and connection objects. The database schema is created/upgraded with migrate_db().
+
+    With read_only=True (used by FinalProject_visualize.py) a read-only connection is returned.
+    If the database does not exist yet or its schema is out of date, it is first created/upgraded
+    with a short-lived write connection.
 
     ARGUMENTS:
         db_name: database filename
+        read_only (bool): whether to return a read-only connection
     RETURNS:
         cur: cursor object
         conn: connection object
     '''
     path = os.path.dirname(os.path.abspath(__file__))
-    conn = sqlite3.connect(path + "/" + db_name)
+    db_path = os.path.join(path, db_name)
+
+    if read_only:
+        needs_upgrade = not os.path.exists(db_path)
+        if not needs_upgrade:
+            conn = connect_db(db_path, read_only=True)
+            needs_upgrade = conn.execute("PRAGMA user_version").fetchone()[0] < MIGRATIONS[-1][0]
+            if not needs_upgrade:
+                return conn.cursor(), conn
+            conn.close()
+
+        write_cur, write_conn = setup_db(db_name)
+        write_conn.close()
+        conn = connect_db(db_path, read_only=True)
+        return conn.cursor(), conn
+
+    conn = connect_db(db_path)
     cur = conn.cursor()
+    migrate_db(cur, conn)
     return cur, conn
 
 
-def create_update_kaggle_db(cur, conn, json_object=None):
+def create_kaggle_tables(cur):
     '''
-    Creates the KaggleData table in the SQLite database and inserts/updates it with the 
-    JSON data retrieved with Kagglehub API. 
-    
+    Creates the Music, KaggleData and Country tables in the SQLite database if they do not exist.
+
     ARGUMENTS:
         cur: cursor object
-        conn: connection object
-        json_object (dict): A dictionary containing the data retrieved with Kaggle API
     RETURNS:
-        cur: cursor object
-        conn: connection object
+        None
     '''
 
     # Create Music table (unique music name and id)
@@ -163,35 +506,107 @@ def create_update_kaggle_db(cur, conn, json_object=None):
         )
     ''')
 
+    create_history_tables(cur)
+
+
+def create_history_tables(cur):
+    '''
+    Creates the tables of the daily chart history: the SnapshotDate date dimension and ChartHistory,
+    one row per (snapshot_date, country, daily_rank). ChartHistory is a WITHOUT ROWID table clustered
+    on its primary key, so the rows of a date range are stored next to each other, and a covering
+    index on (music_id, date_id, ...) serves per-song trajectories.
+
+    ARGUMENTS:
+        cur: cursor object
+    RETURNS:
+        None
+    '''
+    # Date dimension (id = YYYYMMDD, e.g. 20250401, so date ranges are integer ranges)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS SnapshotDate (
+            id INTEGER PRIMARY KEY,
+            date TEXT UNIQUE,
+            year INTEGER,
+            month INTEGER,
+            weekday INTEGER
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS ChartHistory (
+            date_id INTEGER,
+            country_id INTEGER,
+            daily_rank INTEGER,
+            music_id INTEGER,
+            popularity INTEGER,
+            PRIMARY KEY (date_id, country_id, daily_rank),
+            FOREIGN KEY (date_id) REFERENCES SnapshotDate(id),
+            FOREIGN KEY (country_id) REFERENCES Country(id),
+            FOREIGN KEY (music_id) REFERENCES Music(id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chart_history_music
+        ON ChartHistory (music_id, date_id, country_id, daily_rank, popularity)
+    ''')
+
+
+def snapshot_date_id(snapshot_date):
+    '''
+    Returns the SnapshotDate id of a "YYYY-MM-DD" date, e.g. "2025-04-01" -> 20250401.
+    '''
+    return int(snapshot_date[:10].replace("-", ""))
+
+
+def insert_snapshot_dates(cur, snapshot_dates):
+    '''
+    Adds the given "YYYY-MM-DD" dates to the SnapshotDate dimension (existing dates are ignored).
+
+    ARGUMENTS:
+        cur: cursor object
+        snapshot_dates (iterable): dates
+    RETURNS:
+        None
+    '''
+    rows = []
+    for snapshot_date in set(snapshot_dates):
+        date = datetime.strptime(snapshot_date[:10], '%Y-%m-%d')
+        rows.append((snapshot_date_id(snapshot_date), snapshot_date[:10], date.year, date.month, date.weekday()))
+    cur.executemany("INSERT OR IGNORE INTO SnapshotDate (id, date, year, month, weekday) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def create_update_kaggle_db(cur, conn, json_object=None, limit=25):
+    '''
+    Creates the KaggleData table in the SQLite database and inserts/updates it with the 
+    JSON data retrieved with Kagglehub API. Updates the table with `limit` (25) or less rows each call.
+    
+    ARGUMENTS:
+        cur: cursor object
+        conn: connection object
+        json_object (iterable): Records (dictionaries) retrieved with Kaggle API. Any iterable works, 
+                                e.g. the generator returned by iter_kaggle_records()
+        limit (int): Maximum number of newly inserted KaggleData rows per call (None: no limit)
+    RETURNS:
+        cur: cursor object
+        conn: connection object
+    '''
+
+    create_kaggle_tables(cur)
+    music_cache = get_name_id_cache(cur, "Music")
+    country_cache = get_name_id_cache(cur, "Country")
+    staged_music, staged_countries = {}, {}   # ids cached only after the commit
+
     # Insert the data into the Music table and KaggleData table
     if json_object is not None:
         count = 0
+        snapshot_dates = set()  # added to SnapshotDate once per call, not once per record
         for music in json_object:
-            if count >= 25:
-                conn.commit()
-                return cur, conn
-            
             name = music["name"]
             country = music["country"]
 
-            # To avoid inconsistent id, check if song exists in the Music table
-            # Without this step, the "id" will be skipped (e.g. 24, 25, 51, 52, ...)
-            cur.execute("SELECT id FROM Music WHERE name = ?", (name,))
-            row = cur.fetchone()
-            if row is None: #insert the data if not there
-                cur.execute("INSERT OR IGNORE INTO Music (name) VALUES (?)", (name,))
-                music_id = cur.lastrowid
-            else:
-                music_id = row[0]
-
-            #Get Country id or insert the data to Country table
-            cur.execute("SELECT id FROM Country WHERE name = ?", (country,))
-            row = cur.fetchone()
-            if row is None: #insert the data if not there
-                cur.execute("INSERT OR IGNORE INTO Country (name) VALUES (?)", (country,))
-                country_id = cur.lastrowid
-            else:
-                country_id = row[0]
+            # Get Music id / Country id from the lookup cache. Names missing from the tables are inserted
+            # (only when missing, so the "id" is not skipped, e.g. 24, 25, 51, 52, ...)
+            music_id = music_cache.get_id(cur, name, staged=staged_music)
+            country_id = country_cache.get_id(cur, country, staged=staged_countries)
             
             # Insert the rest of the data into the KaggleData table
             daily_rank = music["daily_rank"]
@@ -203,59 +618,1114 @@ def create_update_kaggle_db(cur, conn, json_object=None):
             if cur.rowcount == 1:   # rowcount property returns the affected by the previous execute()
                 count += 1          # Thus, if the affected (newly inserted) row is 1, increment count
 
+            # Keep the daily history as well (KaggleData only keeps one rank per song and country)
+            if music.get("snapshot_date"):
+                snapshot_dates.add(music["snapshot_date"])
+                cur.execute('''
+                    INSERT OR IGNORE INTO ChartHistory (date_id, country_id, daily_rank, music_id, popularity)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (snapshot_date_id(music["snapshot_date"]), country_id, daily_rank, music_id, popularity))
+
+            # Stop right after the limit-th new row, so no record is pulled from the iterator and then dropped
+            if limit is not None and count >= limit:
+                break
+
+        insert_snapshot_dates(cur, snapshot_dates)
+
     conn.commit()
+    music_cache.publish(staged_music)
+    country_cache.publish(staged_countries)
     return cur, conn
 
-            
-def create_update_reddit_db(cur, conn, post_dict):
+
+def fetch_name_ids(cur, table, names):
     '''
-    Creates the Reddit table in the SQLite database and inserts/updates it with the 
-    data from the song_post_dict, which is a dictionary containing song names as keys and 
-    lists of Reddit posts as values. Updates the table with 25 or less rows each call.
+    Looks up the ids of many names in a (Music or Country) table with set-based queries,
+    inserting the names that are not in the table yet.
 
     ARGUMENTS:
         cur: cursor object
-        conn: connection object
-        song_post_dict (dict): A dictionary containing song names as keys and lists of Reddit posts as values
+        table (str): "Music" or "Country"
+        names (iterable): names to look up
     RETURNS:
+        name_ids (dict): {name1: id1, name2: id2, ...}
+    '''
+    if table not in ("Music", "Country"):
+        raise ValueError(f"Unknown table: {table}")
+
+    names = list(dict.fromkeys(names))  # unique names, first-seen order
+    name_ids = {}
+
+    def select_ids(lookup_names):
+        # SQLite limits the number of "?" parameters per statement, so query in slices
+        for start_index in range(0, len(lookup_names), 500):
+            name_slice = lookup_names[start_index:start_index + 500]
+            placeholders = ", ".join("?" * len(name_slice))
+            cur.execute(f"SELECT id, name FROM {table} WHERE name IN ({placeholders}) ORDER BY id", name_slice)
+            for row_id, name in cur.fetchall():
+                name_ids.setdefault(name, row_id)
+
+    select_ids(names)
+
+    # Insert only the missing names, so the AUTOINCREMENT ids stay consecutive
+    missing = [name for name in names if name not in name_ids]
+    if missing:
+        cur.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in missing])
+        select_ids(missing)
+
+    return name_ids
+
+
+class NameIdCache:
+    '''
+    In-process name -> id lookup cache for a dimension table (Music or Country), shared by
+    create_update_kaggle_db(), bulk_update_kaggle_db() and create_update_reddit_db(). It is warmed
+    with one bulk query, updated whenever new names are inserted, and bounded: once it holds
+    `max_size` names, the least recently used names are evicted (and looked up again on demand).
+
+    Ids resolved inside an open transaction may still be rolled back (and reused by the next insert),
+    so writers pass a `staged` dict to get_ids() and publish() it only after conn.commit().
+
+    ARGUMENTS:
+        table (str): "Music" or "Country"
+        max_size (int): maximum number of cached names
+    '''
+
+    def __init__(self, table, max_size=200000):
+        self.table = table
+        self.max_size = max_size
+        self.name_ids = OrderedDict()
+        self.warmed = False
+        self.last_row = None    # (id, name) of the highest cached id, see validate()
+
+    def warm(self, cur):
+        '''
+        Fills the cache with (up to max_size) rows of the table with one query.
+        '''
+        cur.execute(f"SELECT id, name FROM {self.table} ORDER BY id DESC LIMIT ?", (self.max_size,))
+        for row_id, name in reversed(cur.fetchall()):
+            # For duplicate names (Country.name is not UNIQUE), keep the lowest id like fetch_name_ids()
+            if name not in self.name_ids:
+                self.put(name, row_id)
+        self.warmed = True
+
+    def put(self, name, row_id):
+        self.name_ids[name] = row_id
+        self.name_ids.move_to_end(name)
+        if self.last_row is None or row_id > self.last_row[0]:
+            self.last_row = (row_id, name)
+        while len(self.name_ids) > self.max_size:
+            self.name_ids.popitem(last=False)
+
+    def publish(self, staged):
+        '''
+        Adds the ids staged by get_ids() to the cache (call it after the transaction was committed).
+        '''
+        for name, row_id in staged.items():
+            self.put(name, row_id)
+        staged.clear()
+
+    def validate(self, cur):
+        '''
+        Empties the cache if the highest cached id no longer names the same row, e.g. because the
+        database file was replaced (a new file can reuse the old one's path and inode).
+        '''
+        if self.last_row is None:
+            return
+        cur.execute(f"SELECT name FROM {self.table} WHERE id = ?", (self.last_row[0],))
+        row = cur.fetchone()
+        if row is None or row[0] != self.last_row[1]:
+            self.clear()
+
+    def get_ids(self, cur, names, insert=True, staged=None):
+        '''
+        Returns {name: id} for the given names. Cache misses are resolved with fetch_name_ids()
+        (inserting the missing names if insert=True) or, with insert=False, only looked up.
+        Misses resolved while the connection has an open transaction are not cached: they are added
+        to `staged` (if given) for publish() after the commit.
+
+        ARGUMENTS:
+            cur: cursor object
+            names (iterable): names to look up
+            insert (bool): whether names missing from the table are inserted
+            staged (dict): ids of the writer's current transaction, {name: id}
+        RETURNS:
+            name_ids (dict): {name1: id1, ...}; with insert=False unknown names are left out
+        '''
+        if not self.warmed and not cur.connection.in_transaction:
+            self.warm(cur)
+
+        name_ids = {}
+        misses = []
+        for name in names:
+            row_id = self.name_ids.get(name)
+            if row_id is not None:
+                self.name_ids.move_to_end(name)
+                name_ids[name] = row_id
+            elif staged is not None and name in staged:
+                name_ids[name] = staged[name]
+            else:
+                misses.append(name)
+
+        if misses:
+            if insert:
+                found = fetch_name_ids(cur, self.table, misses)
+            else:
+                found = {}
+                for start_index in range(0, len(misses), 500):
+                    name_slice = misses[start_index:start_index + 500]
+                    placeholders = ", ".join("?" * len(name_slice))
+                    cur.execute(f"SELECT id, name FROM {self.table} WHERE name IN ({placeholders}) ORDER BY id",
+                                name_slice)
+                    for row_id, name in cur.fetchall():
+                        found.setdefault(name, row_id)
+            if cur.connection.in_transaction:
+                # Possibly inserted by this transaction: only cached once it is committed
+                if staged is not None:
+                    staged.update(found)
+            else:
+                for name, row_id in found.items():
+                    self.put(name, row_id)
+            name_ids.update(found)
+
+        return name_ids
+
+    def get_id(self, cur, name, insert=True, staged=None):
+        '''
+        Returns the id of a single name (None if insert=False and the name is not in the table).
+        '''
+        return self.get_ids(cur, [name], insert, staged).get(name)
+
+    def clear(self):
+        self.name_ids.clear()
+        self.warmed = False
+        self.last_row = None
+
+
+# Lookup caches per database file: {(path, device, inode): {"Music": NameIdCache, "Country": NameIdCache}}
+name_id_caches = {}
+
+
+def get_name_id_cache(cur, table):
+    '''
+    Returns the shared NameIdCache of a table for the database the cursor is connected to. Caches are
+    keyed by the file's path and inode and checked with NameIdCache.validate(), so a database file
+    that was deleted and created again does not reuse the ids cached for the old file.
+
+    ARGUMENTS:
+        cur: cursor object
+        table (str): "Music" or "Country"
+    RETURNS:
+        cache (NameIdCache)
+    '''
+    cur.execute("PRAGMA database_list")
+    db_file = cur.fetchone()[2]
+    if db_file:
+        file_stat = os.stat(db_file)
+        db_key = (db_file, file_stat.st_dev, file_stat.st_ino)
+    else:
+        # In-memory databases have no file name; they are only shared within their own connection
+        db_key = ("memory", id(cur.connection), cur.connection)
+
+    if db_key not in name_id_caches:
+        # Drop the caches of a replaced file at the same path
+        for old_key in [key for key in name_id_caches if key[0] == db_key[0] and db_file]:
+            del name_id_caches[old_key]
+        name_id_caches[db_key] = {"Music": NameIdCache("Music"), "Country": NameIdCache("Country")}
+    cache = name_id_caches[db_key][table]
+    cache.validate(cur)
+    return cache
+
+
+def clear_name_id_caches():
+    '''
+    Empties every lookup cache.
+    '''
+    for caches in name_id_caches.values():
+        for cache in caches.values():
+            cache.clear()
+
+
+def bulk_update_kaggle_db(cur, conn, records, batch_size=5000, stats=None):
+    '''
+    Bulk version of create_update_kaggle_db() without the 25-row limit. Records are processed
+    `batch_size` at a time: Music and Country ids of a batch are resolved through the shared
+    NameIdCache (set-based queries for the misses), and its KaggleData rows and (for records with
+    a snapshot_date) ChartHistory rows are written with executemany(). All batches are written in
+    one transaction, which is rolled back if anything fails.
+
+    ARGUMENTS:
         cur: cursor object
         conn: connection object
+        records (iterable): Records (dictionaries) retrieved with Kaggle API
+        batch_size (int): Number of records resolved and inserted per executemany()
+        stats (dict): optional, filled with "records" (records processed), "inserted" (new KaggleData
+                      rows) and "history" (new ChartHistory rows)
+    RETURNS:
+        inserted (int): number of newly inserted KaggleData rows
+    '''
+    create_kaggle_tables(cur)
+    music_cache = get_name_id_cache(cur, "Music")
+    country_cache = get_name_id_cache(cur, "Country")
+
+    counts = {"records": 0, "inserted": 0, "history": 0}
+    batch = []
+    staged_music, staged_countries = {}, {}   # ids cached only after the commit
+
+    def write_batch(batch):
+        music_ids = music_cache.get_ids(cur, [music["name"] for music in batch], staged=staged_music)
+        country_ids = country_cache.get_ids(cur, [music["country"] for music in batch], staged=staged_countries)
+        rows = [(music_ids[music["name"]], country_ids[music["country"]], music["daily_rank"], music["popularity"])
+                for music in batch]
+        cur.executemany("INSERT OR IGNORE INTO KaggleData (music_id, country_id, daily_rank, popularity) VALUES (?, ?, ?, ?)",
+                        rows)
+        counts["records"] += len(batch)
+        counts["inserted"] += cur.rowcount  # total number of rows inserted by executemany()
+
+        dated = [music for music in batch if music.get("snapshot_date")]
+        if dated:
+            insert_snapshot_dates(cur, [music["snapshot_date"] for music in dated])
+            history_rows = [(snapshot_date_id(music["snapshot_date"]), country_ids[music["country"]],
+                             music["daily_rank"], music_ids[music["name"]], music["popularity"])
+                            for music in dated]
+            cur.executemany('''
+                INSERT OR IGNORE INTO ChartHistory (date_id, country_id, daily_rank, music_id, popularity)
+                VALUES (?, ?, ?, ?, ?)
+            ''', history_rows)
+            counts["history"] += cur.rowcount
+
+    try:
+        for music in records:
+            batch.append(music)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+        conn.commit()
+    except Exception:
+        # Also for bad records (e.g. a KeyError), so no half-written batch is committed later
+        conn.rollback()
+        raise
+    music_cache.publish(staged_music)
+    country_cache.publish(staged_countries)
+
+    if stats is not None:
+        stats.update(counts)
+    return counts["inserted"]
+
+            
+def create_reddit_table(cur):
+    '''
+    Creates the Reddit table in the SQLite database if it does not exist.
+
+    ARGUMENTS:
+        cur: cursor object
+    RETURNS:
+        None
     '''
     cur.execute('''
         CREATE TABLE IF NOT EXISTS Reddit (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT UNIQUE,
+            id INTEGER PRIMARY KEY,
+            title TEXT,
             music_id INTEGER,
+            created_utc REAL,
+            subreddit TEXT,
+            score INTEGER,
             FOREIGN KEY (music_id) REFERENCES Music(id)
         )
-    ''')
+    ''') # id is the Reddit post id (base 36) decoded to an integer, see reddit_post_key()
+
+
+def reddit_post_key(post_id):
+    '''
+    Decodes a Reddit post id (base 36, e.g. "1jq3k2x" or "t3_1jq3k2x") into the integer used as
+    the Reddit table's primary key.
+
+    ARGUMENTS:
+        post_id (str): Reddit post id
+    RETURNS:
+        key (int)
+    '''
+    if post_id.startswith("t3_"):
+        post_id = post_id[3:]
+    return int(post_id, 36)
+
+
+def create_update_reddit_db(cur, conn, post_dict, limit=25, stats=None):
+    '''
+    Creates the Reddit table in the SQLite database and inserts/updates it with the 
+    data from the song_post_dict, which is a dictionary containing song names as keys and 
+    lists of Reddit posts as values. Updates the table with `limit` (25) or less rows each call.
+
+    ARGUMENTS:
+        cur: cursor object
+        conn: connection object
+        song_post_dict (dict): A dictionary containing song names as keys and lists of Reddit posts as values
+        limit (int): Maximum number of newly inserted Reddit rows per call (None: no limit)
+        stats (dict): Optional dictionary that receives {"inserted": number of newly inserted Reddit rows}
+                      (counted with cur.rowcount, so rows the MentionCount triggers write are not included)
+    RETURNS:
+        cur: cursor object
+        conn: connection object
+    '''
+    create_reddit_table(cur)
 
     count = 0
+    music_cache = get_name_id_cache(cur, "Music")
+    staged_music = {}   # ids cached only after the commit
+
+    # Posts returned by several (overlapping) group queries are only sent to SQLite once
+    seen_posts = set()
+
+    # Databases upgraded from schema version 3 keep their old posts under negative ids (no post id).
+    # A post found again replaces its legacy row, matched by title (see migration_legacy_reddit_titles())
+    cur.execute("SELECT EXISTS (SELECT 1 FROM Reddit WHERE id < 0)")
+    has_legacy_rows = cur.fetchone()[0] == 1
 
     for music_name, posts in post_dict.items():
+        if not posts:
+            continue
+        music_id = music_cache.get_id(cur, music_name, insert=False, staged=staged_music)
         for post in posts: #list of post dictionaries
-            if count >= 25:
+            if limit is not None and count >= limit:
                 conn.commit()
+                music_cache.publish(staged_music)
+                if stats is not None:
+                    stats["inserted"] = count
                 return cur, conn
-            cur.execute("SELECT id FROM Music WHERE name = ?", (music_name,))
-            music_id = cur.fetchone()[0]
-            cur.execute("INSERT OR IGNORE INTO Reddit (title, music_id) VALUES (?, ?)",
-                        (post['title'], music_id))
+            post_key = reddit_post_key(post['id'])
+            if post_key in seen_posts:
+                continue
+            seen_posts.add(post_key)
+            if has_legacy_rows:
+                cur.execute("DELETE FROM Reddit WHERE id < 0 AND title = ?", (post['title'],))
+            cur.execute('''
+                INSERT OR IGNORE INTO Reddit (id, title, music_id, created_utc, subreddit, score)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (post_key, post['title'], music_id, post.get('created_utc'), post.get('subreddit'), post.get('score')))
             if cur.rowcount == 1:   # rowcount property returns the affected by the previous execute()
                 count += 1          # Thus, if the affected (newly inserted) row is 1, increment count
 
     conn.commit()
+    music_cache.publish(staged_music)
+    if stats is not None:
+        stats["inserted"] = count
     return cur, conn
 
 
-def search_reddit_posts(cur):
+def migration_base_tables(cur):
+    '''
+    Schema version 1: the original Music, KaggleData, Country and Reddit tables.
+    '''
+    create_kaggle_tables(cur)
+    create_reddit_table(cur)
+
+
+def migration_indexes(cur):
+    '''
+    Schema version 2: makes Country.name unique and adds the indexes used by name lookups and by
+    the Music/Reddit/KaggleData/Country joins in FinalProject_visualize.py.
+    '''
+
+    # Merge duplicate Country names into the row with the lowest id before adding the UNIQUE index
+    # (rows that would then duplicate an existing (music_id, country_id) pair are dropped)
+    cur.execute('''
+        UPDATE OR IGNORE KaggleData
+        SET country_id = (
+            SELECT MIN(c2.id) FROM Country c1 JOIN Country c2 ON c1.name = c2.name
+            WHERE c1.id = KaggleData.country_id
+        )
+        WHERE country_id IN (SELECT id FROM Country)
+    ''')
+    cur.execute('''
+        DELETE FROM KaggleData
+        WHERE country_id IN (SELECT id FROM Country WHERE id NOT IN (SELECT MIN(id) FROM Country GROUP BY name))
+    ''')
+    cur.execute("DELETE FROM Country WHERE id NOT IN (SELECT MIN(id) FROM Country GROUP BY name)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_country_name ON Country (name)")
+
+    # Reddit -> Music joins and per-song mention counts
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reddit_music ON Reddit (music_id)")
+
+    # Covering indexes for the KaggleData joins: by song (Music JOIN KaggleData) and by country
+    # (WHERE country_id = ? / JOIN Country), so rank and popularity are read from the index only
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_kaggle_music_cover
+        ON KaggleData (music_id, country_id, daily_rank, popularity)
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_kaggle_country_cover
+        ON KaggleData (country_id, music_id, daily_rank, popularity)
+    ''')
+
+
+def migration_crawl_state(cur):
+    '''
+    Schema version 3: CrawlState table with the per-song watermark of the incremental Reddit crawl
+    (created_utc and id of the newest post seen for the song), see crawl_reddit_incremental().
+    '''
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS CrawlState (
+            music_id INTEGER PRIMARY KEY,
+            newest_created_utc REAL,
+            newest_post_id TEXT,
+            updated_utc REAL,
+            FOREIGN KEY (music_id) REFERENCES Music(id)
+        )
+    ''')
+
+
+def migration_reddit_post_key(cur):
+    '''
+    Schema version 4: the Reddit table is keyed by the decoded Reddit post id (INTEGER PRIMARY KEY)
+    instead of deduplicating on a UNIQUE title, and stores created_utc, subreddit and score.
+    Rows from older databases have no post id; they are kept with their old id negated until the
+    same post is found again (see migration_legacy_reddit_titles()).
+    '''
+    cur.execute("PRAGMA table_info(Reddit)")
+    if "created_utc" in [row[1] for row in cur.fetchall()]:
+        return  # created with the current schema
+
+    cur.execute("ALTER TABLE Reddit RENAME TO RedditOld")
+    cur.execute("DROP INDEX IF EXISTS idx_reddit_music")
+    create_reddit_table(cur)
+    cur.execute("INSERT INTO Reddit (id, title, music_id) SELECT -id, title, music_id FROM RedditOld")
+    cur.execute("DROP TABLE RedditOld")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reddit_music ON Reddit (music_id)")
+
+
+def migration_mention_count(cur):
+    '''
+    Schema version 5: MentionCount table with the number of Reddit posts per song, kept up to date
+    by triggers on Reddit inserts, deletes and music_id updates, so ranked mention counts are read
+    without aggregating the Reddit table.
+    '''
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS MentionCount (
+            music_id INTEGER PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (music_id) REFERENCES Music(id)
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_mention_count ON MentionCount (count DESC, music_id)")
+    cur.execute("DELETE FROM MentionCount")
+    cur.execute('''
+        INSERT INTO MentionCount (music_id, count)
+        SELECT music_id, COUNT(*) FROM Reddit WHERE music_id IS NOT NULL GROUP BY music_id
+    ''')
+
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reddit_insert_mention AFTER INSERT ON Reddit
+        WHEN new.music_id IS NOT NULL
+        BEGIN
+            INSERT INTO MentionCount (music_id, count) VALUES (new.music_id, 1)
+            ON CONFLICT (music_id) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reddit_delete_mention AFTER DELETE ON Reddit
+        WHEN old.music_id IS NOT NULL
+        BEGIN
+            UPDATE MentionCount SET count = count - 1 WHERE music_id = old.music_id;
+        END
+    ''')
+    cur.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reddit_update_mention AFTER UPDATE OF music_id ON Reddit
+        WHEN old.music_id IS NOT new.music_id
+        BEGIN
+            UPDATE MentionCount SET count = count - 1 WHERE music_id = old.music_id;
+            INSERT INTO MentionCount (music_id, count) SELECT new.music_id, 1 WHERE new.music_id IS NOT NULL
+            ON CONFLICT (music_id) DO UPDATE SET count = count + 1;
+        END
+    ''')
+
+
+def migration_chart_history(cur):
+    '''
+    Schema version 6: SnapshotDate date dimension and ChartHistory table for the daily chart history
+    (see create_history_tables()). KaggleData has no snapshot_date, so the history starts with the
+    next ingest.
+    '''
+    create_history_tables(cur)
+
+
+def migration_legacy_reddit_titles(cur):
+    '''
+    Schema version 7: unique index on the titles of the legacy Reddit rows (negative ids, see
+    migration_reddit_post_key()). Their titles were UNIQUE in the old schema. create_update_reddit_db()
+    uses the index to find the legacy row of a post it inserts again under its real id and to delete it,
+    so re-ingesting after the upgrade does not store (and count) the same post twice.
+    '''
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reddit_legacy_title ON Reddit (title) WHERE id < 0")
+
+
+# Ordered schema upgrades: (version, migration function). Append new versions at the end.
+MIGRATIONS = [
+    (1, migration_base_tables),
+    (2, migration_indexes),
+    (3, migration_crawl_state),
+    (4, migration_reddit_post_key),
+    (5, migration_mention_count),
+    (6, migration_chart_history),
+    (7, migration_legacy_reddit_titles),
+]
+
+
+def migrate_db(cur, conn):
+    '''
+    Upgrades the database schema in place. The current schema version is stored in the database
+    (PRAGMA user_version) and every migration in MIGRATIONS with a higher version is applied in order,
+    each one in its own transaction together with its version bump.
+
+    ARGUMENTS:
+        cur: cursor object
+        conn: connection object
+    RETURNS:
+        version (int): the schema version after the upgrade
+    '''
+    cur.execute("PRAGMA user_version")
+    version = cur.fetchone()[0]
+
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        try:
+            cur.execute("BEGIN")
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {int(migration_version)}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        version = migration_version
+
+    return version
+
+
+class SongMatcher:
+    '''
+    Aho-Corasick multi-pattern matcher for song names. The song names are compiled once into an
+    automaton (a trie of the lowercased names with failure links), after which all song names
+    mentioned in a text are found in a single pass over the text, instead of one `in` check
+    per song.
+
+    ARGUMENTS:
+        song_names (list): song names to match (case-insensitive)
+        word_boundary (bool): if True, a match only counts when it is not part of a longer word
+                              (e.g. "Taste" does not match "aftertaste")
+    '''
+
+    def __init__(self, song_names, word_boundary=False):
+        self.song_names = list(song_names)
+        self.word_boundary = word_boundary
+
+        # Node 0 is the root. goto[node] = {char: next node}, outputs[node] = [(song index, length), ...]
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+        for index, name in enumerate(self.song_names):
+            pattern = name.lower()
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append((index, len(pattern)))
+
+        # Breadth-first pass to set the failure links (longest proper suffix that is also a prefix)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail_node = self.fail[node]
+                while fail_node and char not in self.goto[fail_node]:
+                    fail_node = self.fail[fail_node]
+                self.fail[next_node] = self.goto[fail_node].get(char, 0)
+                self.outputs[next_node] = self.outputs[next_node] + self.outputs[self.fail[next_node]]
+
+    def find(self, text):
+        '''
+        Returns the indexes (into song_names) of the songs mentioned in the text, in ascending order.
+
+        ARGUMENTS:
+            text (str): text to search (e.g. post title + selftext)
+        RETURNS:
+            matches (list): sorted list of song indexes
+        '''
+        text = text.lower()
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        matches = set()
+
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index, length in outputs[node]:
+                if index in matches:
+                    continue
+                if self.word_boundary:
+                    start = position - length + 1
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if position + 1 < len(text) and text[position + 1].isalnum():
+                        continue
+                matches.add(index)
+
+        return sorted(matches)
+
+    def find_names(self, text):
+        '''
+        Returns the song names mentioned in the text (in song_names order).
+        '''
+        return [self.song_names[index] for index in self.find(text)]
+
+
+REDDIT_SUBREDDITS = "Music+hiphopheads+popheads+popculturechat"
+REDDIT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reddit_cache.db")
+
+
+class RedditSearchCache:
+    '''
+    On-disk (SQLite) cache of Reddit search responses, so rerunning the pipeline does not repeat
+    the same network requests. Responses are keyed by the normalized query, the subreddit set,
+    sort, time_filter and limit, expire after `ttl` seconds, and the least recently used responses
+    are evicted once the cache holds more than `max_bytes` of response data. Hit/miss statistics
+    are available with stats(). Safe to share between the search threads.
+
+    ARGUMENTS:
+        path (str): cache database file (default: reddit_cache.db next to this file)
+        ttl (float): seconds a response stays valid
+        max_bytes (int): maximum total size of the cached responses
+    '''
+
+    def __init__(self, path=REDDIT_CACHE_PATH, ttl=6 * 60 * 60, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS SearchCache (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                size INTEGER,
+                created REAL,
+                last_access REAL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_access ON SearchCache (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(query, subreddits, sort, time_filter, limit):
+        '''
+        Returns the cache key of a search. The query is normalized (case, whitespace and the order
+        of its OR terms do not matter), and so is the subreddit set.
+        '''
+        terms = sorted(set(" ".join(query.lower().split()).split(" or ")))
+        subreddit_set = sorted(set(subreddits.lower().split("+")))
+        key_data = json.dumps([terms, subreddit_set, sort, time_filter, limit])
+        return hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+
+    def contains(self, key):
+        '''
+        Whether a valid (not expired) response is cached, without counting a hit or miss.
+        '''
+        with self.lock:
+            row = self.conn.execute("SELECT created FROM SearchCache WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def get(self, key):
+        '''
+        Returns the cached posts of a search (objects with the same attributes as PRAW submissions
+        used by group_search()), or None on a miss.
+        '''
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM SearchCache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counts["misses"] += 1
+                return None
+            if now - row[1] > self.ttl:
+                self.counts["expired"] += 1
+                self.counts["misses"] += 1
+                self.conn.execute("DELETE FROM SearchCache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.counts["hits"] += 1
+            self.conn.execute("UPDATE SearchCache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return [SimpleNamespace(**post) for post in json.loads(row[0])]
+
+    def put(self, key, posts):
+        '''
+        Stores the posts of a search and evicts least recently used responses if needed.
+        '''
+        response = json.dumps([{
+            "id": post.id,
+            "title": post.title,
+            "selftext": post.selftext,
+            "created_utc": post.created_utc,
+            "score": getattr(post, "score", None),
+            "subreddit": str(getattr(post, "subreddit", "")),
+        } for post in posts])
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO SearchCache VALUES (?, ?, ?, ?, ?)",
+                              (key, response, len(response), now, now))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM SearchCache").fetchone()[0]
+            if total > self.max_bytes:
+                # Evict least recently used responses until the cache fits again
+                rows = self.conn.execute("SELECT key, size FROM SearchCache ORDER BY last_access").fetchall()
+                evict_keys = []
+                for old_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evict_keys.append((old_key,))
+                    total -= size
+                self.conn.executemany("DELETE FROM SearchCache WHERE key = ?", evict_keys)
+                self.counts["evictions"] += len(evict_keys)
+            self.conn.commit()
+
+    def stats(self):
+        '''
+        Returns {"hits", "misses", "expired", "evictions", "entries", "bytes", "hit_rate"}.
+        '''
+        with self.lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM SearchCache").fetchone()
+            stats = dict(self.counts)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({"entries": entries, "bytes": total, "hit_rate": stats["hits"] / lookups if lookups else 0.0})
+        return stats
+
+    def close(self):
+        self.conn.close()
+
+
+class TokenBucket:
+    '''
+    Thread-safe token-bucket rate limiter for Reddit API requests. Each request takes one token;
+    tokens refill at `rate` per second up to `capacity`. The refill rate follows the rate-limit budget
+    reported by Reddit (the X-Ratelimit-Remaining / X-Ratelimit-Reset headers, exposed by PRAW as
+    client.auth.limits), and when the budget is used up every caller waits until the reset time.
+
+    ARGUMENTS:
+        rate (float): tokens per second (default: one request per 0.6 seconds)
+        capacity (int): maximum number of tokens (burst size)
+    '''
+
+    def __init__(self, rate=1 / 0.6, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a token is available and takes it.
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def update_from_limits(self, limits, reserve=2):
+        '''
+        Adjusts the refill rate to the remaining budget reported by Reddit.
+
+        ARGUMENTS:
+            limits (dict): {"remaining": float, "reset_timestamp": float, "used": int} (client.auth.limits)
+            reserve (int): requests kept in reserve before backing off until the reset time
+        RETURNS:
+            None
+        '''
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None or reset_timestamp is None:
+            return
+
+        seconds_to_reset = max(reset_timestamp - time.time(), 1.0)
+        with self.lock:
+            if remaining <= reserve:
+                # Budget used up: back off until the window resets
+                self.blocked_until = time.monotonic() + seconds_to_reset
+                self.tokens = 0
+            else:
+                self.rate = (remaining - reserve) / seconds_to_reset
+
+    def backoff(self, seconds):
+        '''
+        Stops handing out tokens for the given number of seconds (e.g. after HTTP 429).
+        '''
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+def too_many_requests_error():
+    '''
+    Returns the exception praw raises when Reddit answers with HTTP 429 (prawcore is imported on first use).
+    '''
+    import prawcore
+    return prawcore.exceptions.TooManyRequests
+
+
+def rate_limited_group_search(song_names, limiter, client=None, retries=3, max_posts=100, stats=None,
+                              newer_than=None, cache=None, subreddits=REDDIT_SUBREDDITS):
+    '''
+    Calls group_search() after taking a token from the limiter (incremental searches take one more
+    token per extra page), updates the limiter with the rate-limit budget reported by the client, and retries with exponential backoff when
+    Reddit answers with HTTP 429 (Too Many Requests).
+
+    ARGUMENTS:
+        song_names (list): A list of song names to search for.
+        limiter (TokenBucket): shared rate limiter
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client().
+        retries (int): number of retries after HTTP 429
+        max_posts (int): The maximum number of posts to retrieve.
+        stats (dict): see group_search()
+        newer_than (float): see group_search()
+        cache (RedditSearchCache): see group_search(). Cached searches do not take a token.
+        subreddits (str): see group_search()
+    RETURNS:
+        posts_by_song (dict): see group_search()
+    '''
+    client = client if client is not None else get_reddit_client()
+    if cache is not None and newer_than is None:
+        key = cache.make_key(build_query(song_names), subreddits, "top", "month", max_posts)
+        if cache.contains(key):
+            return group_search(song_names, max_posts, client=client, stats=stats, cache=cache,
+                                subreddits=subreddits)
+
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return group_search(song_names, max_posts, client=client, stats=stats, newer_than=newer_than,
+                                cache=cache, subreddits=subreddits, limiter=limiter)
+        except too_many_requests_error():
+            if attempt == retries:
+                raise
+            limiter.backoff(2 ** attempt * 5)
+        finally:
+            auth = getattr(client, "auth", None)
+            limits = getattr(auth, "limits", None)
+            if limits:
+                limiter.update_from_limits(limits)
+
+
+REDDIT_MAX_QUERY_LENGTH = 512  # Reddit search ignores/rejects longer queries
+REDDIT_PAGE_SIZE = 100          # posts per listing request (PRAW pages through results 100 at a time)
+REDDIT_LISTING_LIMIT = 1000     # Reddit listings end after about 1000 posts, however many match
+
+
+def paced_listing(listing, limiter, page_size=REDDIT_PAGE_SIZE):
+    '''
+    Yields the posts of a PRAW listing, taking a token from the limiter before each page after
+    the first one (PRAW requests the next page when the current one is used up). Stopping the
+    iteration early (e.g. at a watermark) requests no further page.
+
+    ARGUMENTS:
+        listing (iterable): posts returned by subreddit.search()
+        limiter (TokenBucket): shared rate limiter (None: no pacing)
+        page_size (int): posts per listing request
+    RETURNS:
+        generator: yields the posts
+    '''
+    for index, post in enumerate(listing, 1):
+        yield post
+        if limiter is not None and index % page_size == 0:
+            limiter.acquire()
+
+
+def build_query(song_names):
+    '''
+    Builds the Reddit search query for a group of songs: '"song1" OR "song2" OR ... OR "song5"'
+    '''
+    return " OR ".join([f'"{name}"' for name in song_names])
+
+
+def plan_song_groups(songs, expected_posts=None, max_posts=100, max_query_length=REDDIT_MAX_QUERY_LENGTH):
+    '''
+    Packs songs into search groups. Each group's query stays within Reddit's query-length limit,
+    and the expected number of posts of a group (e.g. the song's mention count from earlier crawls)
+    stays within max_posts, so popular songs get small groups (or a group of their own) while many
+    low-yield songs share one request.
+
+    ARGUMENTS:
+        songs (list): song names
+        expected_posts (dict): {song name: expected number of posts}. Unknown songs count as 1.
+        max_posts (int): result cap of one search request
+        max_query_length (int): maximum length of a query built with build_query()
+    RETURNS:
+        song_groups (list): [["song1", "song2", ...], ...]
+    '''
+    expected_posts = expected_posts or {}
+
+    def expected(song):
+        return max(expected_posts.get(song, 1), 1)
+
+    # Next-fit decreasing: the highest-yield songs first, so low-yield songs end up packed together
+    ordered_songs = sorted(songs, key=expected, reverse=True)
+
+    song_groups = []
+    group = []
+    group_length = 0
+    group_posts = 0
+    for song in ordered_songs:
+        song_length = len(song) + 2  # quotes
+        separator_length = len(" OR ") if group else 0
+        fits_query = group_length + separator_length + song_length <= max_query_length
+        fits_posts = group_posts + expected(song) <= max_posts
+        if group and not (fits_query and fits_posts):
+            song_groups.append(group)
+            group, group_length, group_posts, separator_length = [], 0, 0, 0
+        group.append(song)
+        group_length += separator_length + song_length
+        group_posts += expected(song)
+    if group:
+        song_groups.append(group)
+
+    return song_groups
+
+
+def adaptive_group_search(song_names, limiter, client=None, max_posts=100, newer_than=None, stats=None,
+                          cache=None, subreddits=REDDIT_SUBREDDITS):
+    '''
+    Searches a group of songs with rate_limited_group_search(). If the search returns max_posts
+    posts (the result cap, so posts were probably cut off), the group is split in two halves and
+    each half is searched again, until a group is no longer saturated or holds a single song.
+    Incremental searches (newer_than) have no result cap and page down to the watermark, so they
+    are only saturated when they reach the end of Reddit's listing (REDDIT_LISTING_LIMIT posts).
+
+    ARGUMENTS:
+        song_names (list): A list of song names to search for.
+        limiter (TokenBucket): shared rate limiter
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client().
+        max_posts (int): The maximum number of posts to retrieve per request.
+        newer_than (float): see group_search()
+        stats (dict): Optional dictionary that receives {"newest": newest created_utc seen,
+                      "incomplete": set of songs whose single-song search was still saturated}
+        cache (RedditSearchCache): see group_search()
+        subreddits (str): see group_search()
+    RETURNS:
+        posts_by_song (dict): see group_search()
+    '''
+    search_stats = {}
+    posts_by_song = rate_limited_group_search(song_names, limiter, client, max_posts=max_posts,
+                                              stats=search_stats, newer_than=newer_than, cache=cache,
+                                              subreddits=subreddits)
+    result_cap = max_posts if newer_than is None else REDDIT_LISTING_LIMIT
+    saturated = search_stats.get("posts", 0) >= result_cap
+    if stats is not None:
+        stats["newest"] = max(stats.get("newest") or 0, search_stats.get("newest") or 0) or None
+        stats.setdefault("incomplete", set())
+        if saturated and len(song_names) <= 1:
+            stats["incomplete"].update(song_names)
+
+    if not saturated or len(song_names) <= 1:
+        return posts_by_song
+
+    middle = len(song_names) // 2
+    for half in (song_names[:middle], song_names[middle:]):
+        half_posts = adaptive_group_search(half, limiter, client, max_posts, newer_than, stats, cache, subreddits)
+        for song_name, posts in half_posts.items():
+            # Keep the posts already found by the bigger query, add the new ones
+            seen_ids = set(post["id"] for post in posts_by_song[song_name])
+            for post in posts:
+                if post["id"] not in seen_ids:
+                    seen_ids.add(post["id"])
+                    posts_by_song[song_name].append(post)
+
+    return posts_by_song
+
+
+def plan_reddit_search(cur, grouping_size=None, max_posts=100):
+    """
+    Reads the song names from the Music table and groups them for searching: adaptive groups from
+    plan_song_groups() (grouping_size=None), or fixed-size groups.
+
+    ARGUMENTS:
+        cur: cursor object
+        grouping_size (int): fixed number of songs per group (None: adaptive planning)
+        max_posts (int): The maximum number of posts to retrieve per request.
+    RETURNS:
+        song_groups (list): [["song_name1", "song_name2", ...], ...]
+    """
+    cur.execute("SELECT name FROM Music")   
+    songs = [row[0] for row in cur.fetchall()] #list of music names from MUSIC table
+    total_songs = len(songs)
+
+    if grouping_size is None:
+        # Mention counts from earlier crawls as the expected yield of each song
+        cur.execute('''
+            SELECT Music.name, COUNT(Reddit.id)
+            FROM Music
+            JOIN Reddit ON Reddit.music_id = Music.id
+            GROUP BY Music.id
+        ''')
+        expected_posts = dict(cur.fetchall())
+        song_groups = plan_song_groups(songs, expected_posts, max_posts)
+    else:
+        # Increase the start_index by +grouping_size (5) each time, until it reaches total_songs (100)
+        # Updates the grouped_songs list with 5 songs each time
+        song_groups = []
+        for start_index in range(0, total_songs, grouping_size):
+            end_index = min(start_index + grouping_size, total_songs)  # avoid IndexError
+            song_groups.append(songs[start_index:end_index])  # ["song_name1", "song_name2", ..., "song_name5"]
+
+    return song_groups
+
+
+def search_reddit_posts(cur, max_workers=1, client=None, limiter=None, grouping_size=None, max_posts=100,
+                        cache=None, subreddits=REDDIT_SUBREDDITS):
     """
     Groups up the song names from the Music table and calls group_search() to search
-    Reddit posts containing the song names. Groups 5 songs together per Reddit API 
+    Reddit posts containing the song names. Groups songs together per Reddit API 
     .search() method to increase request efficiency. 
 
+    By default the groups are planned with plan_song_groups(): as many songs as fit in one query,
+    using the mention counts already in the Reddit table as the expected yield of each song, and
+    saturated searches are split and searched again (adaptive_group_search()). With grouping_size,
+    songs are packed into fixed-size groups (e.g. 5) instead.
+
+    With max_workers > 1 several group searches are kept in flight at the same time
+    (thread pool). Requests are always paced by a TokenBucket limiter that follows
+    the rate-limit budget reported by Reddit.
+
     ARGUMENTS:
         cur: cursor object
+        max_workers (int): number of group searches in flight at the same time
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client()
+                in each search worker thread, so every worker has its own client (a client passed here is
+                shared by all workers).
+        limiter (TokenBucket): rate limiter (a new one is created if None)
+        grouping_size (int): fixed number of songs per group (None: adaptive planning)
+        max_posts (int): The maximum number of posts to retrieve per request.
+        cache (RedditSearchCache): Optional on-disk cache of search responses
+        subreddits (str): subreddits to search, joined with "+" (see group_search())
     RETURNS:
         song_posts (dict): A dictionary where keys are song names and values are lists of Reddit posts
         containing those song names in titles or texts. Each key-value pair is returned from group_search().
@@ -264,46 +1734,235 @@ def search_reddit_posts(cur):
     # {"song_name1": [{post1 data}, {post2 data}, ...], "song_name2": [{post1}, {post2}, ...], ...}
     song_posts = {}
 
-    grouping_size = 5   # Number of songs to group for efficient search
-    cur.execute("SELECT name FROM Music")   
-    songs = [row[0] for row in cur.fetchall()] #list of music names from MUSIC table
-    total_songs = len(songs)
+    song_groups = plan_reddit_search(cur, grouping_size, max_posts)
 
-    # Increase the start_index by +grouping_size (5) each time, until it reaches total_songs (100)
-    # Updates the grouped_songs list with 5 songs each time
-    for start_index in range(0, total_songs, grouping_size):
-        grouped_songs = [] # ["song_name1", "song_name2", ..., "song_name5"]
-        end_index = min(start_index + grouping_size, total_songs)  # avoid IndexError
+    if limiter is None:
+        limiter = TokenBucket()
 
-        for i in range(start_index, end_index):
-            grouped_songs.append(songs[i])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if grouping_size is None:
+            futures = [executor.submit(adaptive_group_search, grouped_songs, limiter, client, max_posts,
+                                       cache=cache, subreddits=subreddits)
+                       for grouped_songs in song_groups]
+        else:
+            futures = [executor.submit(rate_limited_group_search, grouped_songs, limiter, client,
+                                       max_posts=max_posts, cache=cache, subreddits=subreddits)
+                       for grouped_songs in song_groups]
+        for future in futures:  # in submission order, so the result does not depend on timing
+            for song_name, posts in future.result().items():
+                song_posts[song_name] = posts
 
-        group_search_results = group_search(grouped_songs)
+    return song_posts
 
-        for song_name, posts in group_search_results.items():
-            song_posts[song_name] = posts
 
-        time.sleep(0.6)
+def pipeline_reddit_posts(db_name, max_workers=4, client=None, limiter=None, grouping_size=None,
+                          max_posts=100, cache=None, batch_size=500, queue_size=64,
+                          subreddits=REDDIT_SUBREDDITS):
+    """
+    Pipelined version of search_reddit_posts() + create_update_reddit_db(). Search workers (thread
+    pool) push the matched posts of each group into a bounded queue, and a single writer thread with
+    its own database connection drains the queue and commits every `batch_size` posts. Network time
+    and database writes overlap, memory stays bounded by the queue size, and everything committed
+    before a crash stays in the database.
 
-    return song_posts
+    ARGUMENTS:
+        db_name: database filename (see setup_db())
+        max_workers (int): number of group searches in flight at the same time
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client()
+                in each search worker thread, so every worker has its own client (a client passed here is
+                shared by all workers).
+        limiter (TokenBucket): rate limiter (a new one is created if None)
+        grouping_size (int): fixed number of songs per group (None: adaptive planning)
+        max_posts (int): The maximum number of posts to retrieve per request.
+        cache (RedditSearchCache): Optional on-disk cache of search responses
+        batch_size (int): number of posts written per commit
+        queue_size (int): maximum number of group results waiting for the writer
+        subreddits (str): subreddits to search, joined with "+" (see group_search())
+    RETURNS:
+        inserted (int): number of newly inserted Reddit rows
+    """
+    if limiter is None:
+        limiter = TokenBucket()
+
+    cur, conn = setup_db(db_name)
+    song_groups = plan_reddit_search(cur, grouping_size, max_posts)
+    conn.close()
+
+    post_queue = queue.Queue(maxsize=queue_size)
+    writer_result = {"inserted": 0, "error": None}
+
+    def write_posts():
+        writer_cur, writer_conn = setup_db(db_name)
+        buffered = {}
+        buffered_count = 0
+
+        def flush():
+            insert_stats = {}
+            create_update_reddit_db(writer_cur, writer_conn, buffered, limit=None, stats=insert_stats)
+            writer_result["inserted"] += insert_stats["inserted"]
+
+        try:
+            while True:
+                posts_by_song = post_queue.get()
+                if posts_by_song is None:
+                    break
+                for song_name, posts in posts_by_song.items():
+                    buffered.setdefault(song_name, []).extend(posts)
+                    buffered_count += len(posts)
+                if buffered_count >= batch_size:
+                    flush()
+                    buffered, buffered_count = {}, 0
+            if buffered_count:
+                flush()
+        except Exception as e:
+            writer_result["error"] = e
+            # Keep draining so the search workers never block on a full queue
+            while post_queue.get() is not None:
+                pass
+        finally:
+            writer_conn.close()
+
+    def search_group(grouped_songs):
+        if grouping_size is None:
+            posts_by_song = adaptive_group_search(grouped_songs, limiter, client, max_posts, cache=cache,
+                                                  subreddits=subreddits)
+        else:
+            posts_by_song = rate_limited_group_search(grouped_songs, limiter, client, max_posts=max_posts,
+                                                      cache=cache, subreddits=subreddits)
+        post_queue.put(posts_by_song)
+
+    writer = threading.Thread(target=write_posts, name="reddit-writer")
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(search_group, grouped_songs) for grouped_songs in song_groups]
+            for future in futures:
+                future.result()
+    finally:
+        post_queue.put(None)
+        writer.join()
+
+    if writer_result["error"] is not None:
+        raise writer_result["error"]
+    return writer_result["inserted"]
+
+
+def crawl_reddit_incremental(cur, conn, client=None, limiter=None, max_posts=100, subreddits=REDDIT_SUBREDDITS):
+    """
+    Incremental version of search_reddit_posts() + create_update_reddit_db(). Every song has a
+    watermark in the CrawlState table (created_utc and id of the newest post seen for it). Each planned
+    group is searched newest first down to the oldest watermark of its songs, its new posts are
+    written to the Reddit table, and then the watermarks of its songs are advanced and committed.
+    A song without new posts advances to the newest post of its group search (with no post id),
+    since every post down to that one was seen.
+    A later run only fetches posts newer than the watermarks, and an interrupted run resumes with
+    the groups that were not committed yet.
+
+    ARGUMENTS:
+        cur: cursor object
+        conn: connection object
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client().
+        limiter (TokenBucket): rate limiter (a new one is created if None)
+        max_posts (int): The maximum number of posts to retrieve per request.
+        subreddits (str): subreddits to search, joined with "+" (see group_search())
+    RETURNS:
+        inserted (int): number of newly inserted Reddit rows
+    """
+    create_reddit_table(cur)
+    if limiter is None:
+        limiter = TokenBucket()
 
+    cur.execute('''
+        SELECT Music.id, Music.name, CrawlState.newest_created_utc
+        FROM Music
+        LEFT JOIN CrawlState ON CrawlState.music_id = Music.id
+    ''')
+    song_rows = cur.fetchall()
+    song_ids = {name: music_id for music_id, name, _ in song_rows}
+    watermarks = {name: newest for _, name, newest in song_rows}
 
-def group_search(song_names, max_posts=100):
+    cur.execute('''
+        SELECT Music.name, COUNT(Reddit.id)
+        FROM Music
+        JOIN Reddit ON Reddit.music_id = Music.id
+        GROUP BY Music.id
+    ''')
+    expected_posts = dict(cur.fetchall())
+
+    # Songs with similar watermarks are planned together, so one stale song does not make
+    # a whole group refetch old posts
+    songs = sorted(song_ids, key=lambda name: watermarks[name] or 0)
+    song_groups = plan_song_groups(songs, expected_posts, max_posts)
+
+    inserted = 0
+    for grouped_songs in song_groups:
+        group_watermarks = [watermarks[name] for name in grouped_songs]
+        newer_than = None if None in group_watermarks else min(group_watermarks)
+
+        stats = {}
+        posts_by_song = adaptive_group_search(grouped_songs, limiter, client, max_posts, newer_than, stats,
+                                              subreddits=subreddits)
+
+        insert_stats = {}
+        create_update_reddit_db(cur, conn, posts_by_song, limit=None, stats=insert_stats)
+        inserted += insert_stats["inserted"]
+
+        # Advance the watermarks (only for songs whose posts were all seen). newest_created_utc and
+        # newest_post_id always describe the same post: the song's own newest post if it has one
+        newest = stats.get("newest")
+        rows = []
+        for name in grouped_songs:
+            if name in stats["incomplete"] or newest is None:
+                continue
+            if posts_by_song[name]:
+                newest_post = max(posts_by_song[name], key=lambda post: post["created_utc"])
+                rows.append((song_ids[name], newest_post["created_utc"], newest_post["id"], time.time()))
+            else:
+                rows.append((song_ids[name], newest, None, time.time()))
+        cur.executemany('''
+            INSERT INTO CrawlState (music_id, newest_created_utc, newest_post_id, updated_utc)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (music_id) DO UPDATE SET
+                newest_created_utc = MAX(newest_created_utc, excluded.newest_created_utc),
+                newest_post_id = CASE WHEN excluded.newest_created_utc > newest_created_utc
+                                      THEN excluded.newest_post_id ELSE newest_post_id END,
+                updated_utc = excluded.updated_utc
+        ''', rows)
+        conn.commit()
+
+    return inserted
+
+
+def group_search(song_names, max_posts=100, client=None, matcher=None, stats=None, newer_than=None, cache=None,
+                 subreddits=REDDIT_SUBREDDITS, limiter=None):
     """
     Searches for the top Reddit posts from the past month mentioning each song name 
     in the specified list of subreddits. Groups up the subreddit names to increase request efficiency.
 
     ARGUMENTS:
         song_names (list): A list of song names to search for.
-        max_posts (int): The maximum number of posts to retrieve.
+        max_posts (int): The maximum number of posts to retrieve (not used by incremental searches).
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client().
+        matcher (SongMatcher): Optional precompiled matcher (e.g. over all tracked songs). Only the
+                               song_names of this group are reported.
+        stats (dict): Optional dictionary that receives {"posts": number of posts returned by the search,
+                      "newest": created_utc of the newest post returned (None if no posts)}
+        newer_than (float): Optional watermark (created_utc). If given, posts are searched newest first,
+                            page after page without the max_posts cap, and the search stops at the
+                            first post that is not newer than the watermark.
+        cache (RedditSearchCache): Optional on-disk response cache. Used for full (not incremental) searches.
+        subreddits (str): subreddits to search, joined with "+" (default: REDDIT_SUBREDDITS)
+        limiter (TokenBucket): Optional rate limiter; incremental searches take a token per extra page
     RETURNS:
         posts_by_song (dict): A dictionary where keys are song names and values are lists of Reddit posts
         containing those song names in titles or texts.
     """
+    client = client if client is not None else get_reddit_client()
+
     # Group up the subreddits to search in
-    subreddit_group = "Music+hiphopheads+popheads+popculturechat"
+    subreddit_group = subreddits
     # '"song1" OR "song2" OR ... OR "song5"'
-    query = " OR ".join([f'"{name}"' for name in song_names])
+    query = build_query(song_names)
 
     # Prepopulated dictionary 
     # {"song_name1": [{post1 data}, {post2 data}, ...], "song_name2": [{post1}, {post2}, ...], ...}
@@ -311,20 +1970,57 @@ def group_search(song_names, max_posts=100):
     for name in song_names:
         posts_by_song[name] = []
 
-    subreddit = reddit.subreddit(subreddit_group)
-    # Search for posts in the chosen subreddits
-    for post in subreddit.search(query, sort="top", time_filter="month", limit=max_posts):
-        # Text of the title and selftext of the post (lowercased for proper match count)
-        text = (post.title + " " + post.selftext).lower()
-
-        # Check if the post contains the music name. If so, insert into dictionary
-        for song in song_names:
-            if song.lower() in text:
-                post_data = {
-                    "id": post.id,
-                    "title": post.title,
-                }
-                posts_by_song[song].append(post_data)
+    # Compile the song names once (case-insensitive Aho-Corasick automaton)
+    if matcher is None:
+        matcher = SongMatcher(song_names)
+
+    post_count = 0
+    newest = None
+    # Incremental searches go newest first, so they can stop at the watermark (and fetch no further pages)
+    sort = "top" if newer_than is None else "new"
+
+    # Search for posts in the chosen subreddits (or reuse a cached response of the same search)
+    search_results = None
+    if cache is not None and newer_than is None:
+        cache_key = cache.make_key(query, subreddit_group, sort, "month", max_posts)
+        search_results = cache.get(cache_key)
+        if search_results is None:
+            subreddit = client.subreddit(subreddit_group)
+            search_results = list(subreddit.search(query, sort=sort, time_filter="month", limit=max_posts))
+            cache.put(cache_key, search_results)
+    elif newer_than is None:
+        subreddit = client.subreddit(subreddit_group)
+        search_results = subreddit.search(query, sort=sort, time_filter="month", limit=max_posts)
+    else:
+        # Cost stays proportional to the new posts: every page newer than the watermark is fetched
+        subreddit = client.subreddit(subreddit_group)
+        search_results = paced_listing(subreddit.search(query, sort=sort, time_filter="month", limit=None), limiter)
+
+    for post in search_results:
+        if newer_than is not None and post.created_utc <= newer_than:
+            break
+        post_count += 1
+        if newest is None or post.created_utc > newest:
+            newest = post.created_utc
+        # Text of the title and selftext of the post
+        text = post.title + " " + post.selftext
+
+        # Find every music name the post contains in one pass, and insert the post into the dictionary
+        for song in matcher.find_names(text):
+            if song not in posts_by_song:
+                continue
+            post_data = {
+                "id": post.id,
+                "title": post.title,
+                "created_utc": post.created_utc,
+                "subreddit": str(post.subreddit),
+                "score": post.score,
+            }
+            posts_by_song[song].append(post_data)
+
+    if stats is not None:
+        stats["posts"] = post_count
+        stats["newest"] = newest
 
     return posts_by_song
 
@@ -356,20 +2052,17 @@ def main():
     country1 = input("First country to search for: ")
     country2 = input("Second country to search for: ")
 
-    criteria = {
-        "country": country1,
-        "snapshot_date": date
-    }
-    c1_json_object = load_kaggle_dataset(criteria, load_option)
-
-    criteria = {
-        "country": country2,
-        "snapshot_date": date
-    }
-    c2_json_object = load_kaggle_dataset(criteria, load_option)
+    # Loads both countries with a single scan of the dataset
+    country_records = load_kaggle_countries([country1, country2], date)
 
     # Groups up the US and CA JSON data to pass into create_update_kaggle_db()
-    json_object = c1_json_object + c2_json_object
+    json_object = country_records[country1] + country_records[country2]
+
+    # Option 2: also save the rows as a local json file (from the same scan, for testing and viewing data contents)
+    if load_option == "2":
+        json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'universal_top_spotify_songs.json')
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(json_object, f)
 
     # Sets up the database
     cur, conn = setup_db("final.db")
@@ -387,7 +2080,10 @@ def main():
     print("-----------------------------------------------------------------------------------\n")
 
     print("Searching Reddit Posts...\n")
-    song_post_dict = search_reddit_posts(cur) #fetched post data
+    search_cache = RedditSearchCache()
+    song_post_dict = search_reddit_posts(cur, cache=search_cache) #fetched post data
+    print(f"Reddit search cache: {search_cache.stats()}\n")
+    search_cache.close()
 
     print("Program is designed to run multiple times using a loop to retrieve data from Kaggle and Reddit.")
     print("\t[o]: to start updating database.")
@@ -455,6 +2151,115 @@ def main():
     conn.close()
     '''
 
+def date_range(start_date, end_date):
+    '''
+    Returns the dates from start_date to end_date (inclusive) as "YYYY-MM-DD" strings.
+    '''
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return [(start + timedelta(days)).strftime('%Y-%m-%d') for days in range((end - start).days + 1)]
+
+
+def ingest(countries, start_date, end_date, subreddits=REDDIT_SUBREDDITS, batch_size=5000, db_name="final.db",
+           max_workers=4, incremental=False, client=None, dataset_path=None, use_cache=True):
+    '''
+    Non-interactive version of main(): streams the Kaggle rows of all countries and dates from one scan
+    into the bulk insert, then searches Reddit for every song and writes the posts, all in one process
+    and without the 25-row limits. Prints the throughput (rows per second) of every stage.
+
+    ARGUMENTS:
+        countries (list): ISO 3166-1 alpha-2 country codes (e.g. ["US", "CA"])
+        start_date (str): first snapshot date (e.g. "2025-04-01")
+        end_date (str): last snapshot date (inclusive)
+        subreddits (str): subreddits to search, joined with "+"
+        batch_size (int): rows per executemany() (Kaggle) / posts per commit (Reddit)
+        db_name: database filename
+        max_workers (int): number of Reddit searches in flight at the same time
+        incremental (bool): use crawl_reddit_incremental() (per-song watermarks) for the Reddit stage
+        client: Reddit client (praw.Reddit or a stub with the same interface). Defaults to get_reddit_client()
+                in each search worker thread, so every worker has its own client (a client passed here is
+                shared by all workers).
+        dataset_path (str): Optional local directory containing the csv file (see stream_kaggle_dataset())
+        use_cache (bool): Whether to use the Parquet cache (see stream_kaggle_dataset())
+    RETURNS:
+        summary (list): [(stage, rows, seconds), ...]
+    '''
+    summary = []
+
+    # Stage 1: one scan of the Kaggle dataset for all countries and dates, streamed straight into the
+    # bulk insert, so at most one chunk (and one batch of records) is held in memory at a time
+    start_time = time.perf_counter()
+    cur, conn = setup_db(db_name)
+    criteria = {"country": list(countries), "snapshot_date": date_range(start_date, end_date)}
+
+    def kaggle_records():
+        for chunk in stream_kaggle_dataset(criteria, use_cache=use_cache, dataset_path=dataset_path):
+            # Chunks (csv or Parquet cache) hold up to stream_kaggle_dataset()'s chunksize rows; convert them
+            # a batch at a time
+            for start in range(0, len(chunk), batch_size):
+                yield from iter_kaggle_records(chunk.iloc[start:start + batch_size])
+
+    # Report records processed (not KaggleData + ChartHistory rows), so rows/s is per Kaggle record
+    kaggle_stats = {}
+    bulk_update_kaggle_db(cur, conn, kaggle_records(), batch_size, stats=kaggle_stats)
+    summary.append(("Kaggle load + insert", kaggle_stats["records"], time.perf_counter() - start_time))
+
+    # Stage 2: Reddit search and database writes
+    start_time = time.perf_counter()
+    if incremental:
+        inserted = crawl_reddit_incremental(cur, conn, client, subreddits=subreddits)
+        conn.close()
+    else:
+        conn.close()
+        search_cache = RedditSearchCache()
+        try:
+            inserted = pipeline_reddit_posts(db_name, max_workers, client, batch_size=batch_size,
+                                             cache=search_cache, subreddits=subreddits)
+        finally:
+            search_cache.close()
+    summary.append(("Reddit search + insert", inserted, time.perf_counter() - start_time))
+
+    print("\n-----------------------------------------------------------------------------------")
+    print("Ingest summary")
+    print("-----------------------------------------------------------------------------------")
+    for stage, rows, seconds in summary:
+        rate = rows / seconds if seconds > 0 else 0.0
+        print(f"{stage:<25} {rows:>10} rows {seconds:>10.2f} s {rate:>12.1f} rows/s")
+
+    return summary
+
+
+def parse_args(argv):
+    '''
+    Command line arguments of the headless "ingest" command, e.g.
+        python FinalProject_data.py ingest --countries US CA --start 2025-04-01 --end 2025-04-30
+    '''
+    yesterday = (datetime.now() - timedelta(1)).strftime('%Y-%m-%d')
+
+    parser = argparse.ArgumentParser(description="Music trend analysis with Kaggle and Reddit API - headless ingest")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="load Kaggle and Reddit data without prompts")
+    ingest_parser.add_argument("--countries", nargs="+", required=True, help="country codes, e.g. US CA")
+    ingest_parser.add_argument("--start", default=yesterday, help="first snapshot date (YYYY-MM-DD)")
+    ingest_parser.add_argument("--end", default=None, help="last snapshot date (default: --start)")
+    ingest_parser.add_argument("--subreddits", nargs="+", default=REDDIT_SUBREDDITS.split("+"),
+                               help="subreddits to search")
+    ingest_parser.add_argument("--batch-size", type=int, default=5000, help="rows per database batch")
+    ingest_parser.add_argument("--workers", type=int, default=4, help="Reddit searches in flight")
+    ingest_parser.add_argument("--db", default="final.db", help="database filename")
+    ingest_parser.add_argument("--incremental", action="store_true",
+                               help="only fetch Reddit posts newer than the stored watermarks")
+    ingest_parser.add_argument("--dataset-path", default=None,
+                               help="local directory with the Kaggle csv file (skips the download)")
+    ingest_parser.add_argument("--no-cache", action="store_true", help="read the csv file, not the Parquet cache")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        args = parse_args(sys.argv[1:])
+        ingest(args.countries, args.start, args.end or args.start, "+".join(args.subreddits), args.batch_size,
+               args.db, args.workers, args.incremental, dataset_path=args.dataset_path, use_cache=not args.no_cache)
+    else:
+        main()
 
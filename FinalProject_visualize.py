@@ -2,134 +2,204 @@
 # For PART 3 of FinalProjectInstructions, or part 5 of the GradingScript
 
 import os 
+import sys
+import argparse
+import json
 import sqlite3
 import csv
-import matplotlib
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from FinalProject_data import setup_db
+from FinalProject_analytics import RANK_MATRIX_QUERY, build_rank_matrix, country_similarity
+# matplotlib.pyplot is imported by the drawing functions on first use, so the program starts quickly
 
-def count_reddit_posts(cur):
+# In-process cache of query results: {"connection": connection object, "data_version": int, "results": {}}
+query_cache = {"connection": None, "data_version": None, "results": {}}
+
+
+def cached_query(cur, sql, params=()):
     '''
-    Counts the number of Reddit posts containing each of the song names in the Music table, 
-    and writes the results to a CSV file.
+    Runs a SELECT query, or returns its rows from the in-process result cache. The cache is emptied
+    whenever SQLite's PRAGMA data_version shows that another connection (e.g. the ingester) has
+    committed changes to the database since the results were cached, so repeated charts skip
+    the SQL entirely while the data is unchanged.
 
     ARGUMENTS:
-        cur: cursor object
+        cur: cursor object (of a read-only connection, see setup_db())
+        sql (str): SELECT query
+        params (tuple): query parameters
     RETURNS:
-        None
+        rows (list): the query result rows
     '''
+    cur.execute("PRAGMA data_version")
+    data_version = cur.fetchone()[0]
+    if query_cache["connection"] is not cur.connection or query_cache["data_version"] != data_version:
+        query_cache["connection"] = cur.connection
+        query_cache["data_version"] = data_version
+        query_cache["results"] = {}
+
+    key = (sql, tuple(params))
+    if key not in query_cache["results"]:
+        cur.execute(sql, params)
+        query_cache["results"][key] = cur.fetchall()
+    return query_cache["results"][key]
+
 
-    # Step 1: Get all distinct Music.id and Music.name
-    cur.execute("SELECT id, name FROM Music")
-    music_rows = cur.fetchall()  # [(1, 'NOKIA'), (2, 'luther'), ...]
+def get_mention_counts(cur):
+    '''
+    Returns the number of Reddit posts containing each of the song names in the Music table, 
+    sorted by count DESC. The counts come from the MentionCount table, which triggers on the
+    Reddit table keep up to date, so this is a single (cached) query.
+
+    ARGUMENTS:
+        cur: cursor object
+    RETURNS:
+        mention_counts (list): [(song_name1, count1), (song_name2, count2), ...]
+    '''
+    return cached_query(cur, '''
+        SELECT Music.name, COALESCE(MentionCount.count, 0) AS mention_count
+        FROM Music
+        LEFT JOIN MentionCount ON MentionCount.music_id = Music.id
+        ORDER BY mention_count DESC, Music.id
+    ''')
 
-    result = [("name", "count")]
 
-    # Step 2: For each music entry in Music table, use JOIN to count matching Reddit posts
-    for music_id, music_name in music_rows:
-        cur.execute('''
-            SELECT COUNT(Reddit.id)
-            FROM Reddit
-            JOIN Music ON Reddit.music_id = Music.id
-            WHERE Music.id = ?
-        ''', (music_id,))
-        count = cur.fetchone()[0]
-        result.append((music_name, count))
+def count_reddit_posts(cur, filename="reddit_post_counts.csv"):
+    '''
+    Exports the number of Reddit posts containing each of the song names in the Music table
+    (see get_mention_counts()) to a CSV file.
 
-    # Step 3: Sort results by count DESC (excluding header first)
-    result_body = sorted(result[1:], key=lambda x: x[1], reverse=True)
-    result_sorted = [result[0]] + result_body
+    ARGUMENTS:
+        cur: cursor object
+        filename: the name of the csv file to write
+    RETURNS:
+        None
+    '''
+    result_sorted = [("name", "count")] + get_mention_counts(cur)
 
-    # Step 4: Write to CSV
     current_directory = os.path.dirname(os.path.abspath(__file__))
-    output_path = os.path.join(current_directory, "reddit_post_counts.csv")
+    output_path = os.path.join(current_directory, filename)
     with open(output_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerows(result_sorted)
 
 
-def visualize_spotify_mentions_ordered(cur, filename):
+# Headless rendering settings (see render_charts()). With output_dir None, figures are shown on screen.
+render_settings = {"output_dir": None, "formats": ("png",)}
+
+
+def show_figure(chart_name):
+    '''
+    Shows the current figure, or in headless mode (render_settings["output_dir"] set) saves it
+    as <output_dir>/<chart_name>.<format> for every format and closes it.
+
+    ARGUMENTS:
+        chart_name (str): file name of the chart (without extension)
+    RETURNS:
+        None
+    '''
+    import matplotlib.pyplot as plt
+
+    if render_settings["output_dir"] is None:
+        plt.show()
+        return
+
+    for file_format in render_settings["formats"]:
+        plt.savefig(os.path.join(render_settings["output_dir"], f"{chart_name}.{file_format}"), format=file_format)
+    plt.close("all")
+
+
+def set_song_xticks(song_names, max_labels=60):
+    '''
+    Labels the x-axis of the current figure (songs plotted at positions 0, 1, 2, ...) with the
+    song names. With more than max_labels songs, only every n-th song is labeled, so charts over
+    thousands of songs stay readable and fast to draw.
+
+    ARGUMENTS:
+        song_names (list): song names in x-axis order
+        max_labels (int): maximum number of tick labels
+    RETURNS:
+        None
+    '''
+    import matplotlib.pyplot as plt
+
+    step = max(1, int(np.ceil(len(song_names) / max_labels)))
+    positions = np.arange(0, len(song_names), step)
+    plt.xticks(positions, [song_names[i] for i in positions], rotation=90)
+    plt.xlim(-1, len(song_names))
+
+
+def visualize_spotify_mentions_ordered(cur):
     '''
     Visualizes the Reddit mentions ordered by Spotify daily ranking in a bar chart
-    by reading calculated data from a file. On the x-axis, the songs are ordered ascending by their
+    using the (cached) mention counts. On the x-axis, the songs are ordered ascending by their
     daily_rank. 
 
     ARGUMENTS:
         cur: cursor object
-        filename: the name of file to read data from 
     RETURNS:
         None
     '''
+    import matplotlib.pyplot as plt
 
     # {song1: mentions1, song2: mentions2, ...}
-    song_to_mentions = {}
-
-    # Build the dictionary by reading the CSV file
-    dir = os.path.dirname(__file__)
-    with open(os.path.join(dir, filename)) as file:
-        reader = csv.reader(file)
-        next(reader)
-        for row in reader:
-            song_to_mentions[row[0]] = int(row[1])
+    song_to_mentions = dict(get_mention_counts(cur))
 
     # Get song names and daily ranks from the database
-    cur.execute('''
+    rows = cached_query(cur, '''
         SELECT Music.name, KaggleData.daily_rank
         FROM Music
         JOIN KaggleData ON Music.id = KaggleData.music_id
     ''')
-    rows = cur.fetchall()
     
-    # Build a list of lists [[daily_rank1, song_name1, mentions1], ...] to sort on daily_rank
-    combined = []
+    # Best (lowest) daily_rank of each song; a song charting in several countries gets one bar
+    song_to_rank = {}
     for song_name, daily_rank in rows:
-        mentions = song_to_mentions.get(song_name, 0)  # mention == 0 if not found
-        combined.append([daily_rank, song_name, mentions])
+        if song_name not in song_to_rank or daily_rank < song_to_rank[song_name]:
+            song_to_rank[song_name] = daily_rank
 
-    combined_sorted = sorted(combined, key=lambda x: x[0])  # sorting by daily_rank, ascending
+    names = list(song_to_rank)
+    ranks = np.array([song_to_rank[name] for name in names], dtype=float)
+    mentions = np.array([song_to_mentions.get(name, 0) for name in names])  # mention == 0 if not found
 
-    sorted_ranks = []
-    sorted_names = []
-    sorted_mentions = []
-    for item in combined_sorted:
-        sorted_ranks.append(item[0])
-        sorted_names.append(item[1])
-        sorted_mentions.append(item[2])
+    order = np.argsort(ranks, kind="mergesort")  # sorting by daily_rank, ascending
+    sorted_names = [names[i] for i in order]
+    sorted_mentions = mentions[order]
 
     plt.figure(figsize=(16,8))
-    plt.bar(sorted_names, sorted_mentions)
+    positions = np.arange(len(sorted_names))
+    if len(positions) <= 500:
+        plt.bar(positions, sorted_mentions)
+    else:
+        # One line collection instead of one rectangle artist per song
+        plt.vlines(positions, 0, sorted_mentions, linewidth=max(0.5, 800 / len(positions)))
     plt.xlabel("Songs (Ordered by Spotify Daily Rank)")
     plt.ylabel("Number of Reddit Mentions")
     plt.title("Reddit Mentions by Spotify Daily Rank")
-    plt.xticks(rotation=90)
-    plt.show()
+    set_song_xticks(sorted_names)
+    plt.tight_layout()
+    show_figure("spotify_mentions_ordered")
 
 
-def visualize_top10_reddit_mentions(filename):
+def visualize_top10_reddit_mentions(cur):
     '''
-    Visualizes the top 10 songs by Reddit mention counts by reading from the csv file
-    that stores the song names and their mention counts with Matplotlib 
-    (counts of posts containing the song name).
+    Visualizes the top 10 songs by Reddit mention counts with Matplotlib 
+    (counts of posts containing the song name, see get_mention_counts()).
 
     ARGUMENTS:
-        filename: the name of the csv file containing song names and mention counts
+        cur: cursor object
     RETURNS:
         None
     '''
+    import matplotlib.pyplot as plt
 
-    # To store the song names and mention counts from CSV file
+    # To store the song names and mention counts
     song_name = []
     mention_count = []
 
-    dir = os.path.dirname(__file__)
-    with open(os.path.join(dir, filename)) as file:
-        reader = csv.reader(file)
-        next(reader)
-
-        for row in reader:
-            song_name.append(row[0])
-            mention_count.append(int(row[1]))
+    for name, count in get_mention_counts(cur):
+        song_name.append(name)
+        mention_count.append(count)
 
     # Get the top 10 songs with the most mentions
     top_10_songs = song_name[:10]
@@ -139,7 +209,7 @@ def visualize_top10_reddit_mentions(filename):
     plt.barh(top_10_songs, top_10_mentions)
     plt.xlabel("Number of Reddit Mentions")
     plt.title("Top 10 Songs by Reddit Mentions")
-    plt.show()
+    show_figure("top10_reddit_mentions")
 
 def visualize_ranking_c1_vs_c2_common(cur):
     """
@@ -150,27 +220,24 @@ def visualize_ranking_c1_vs_c2_common(cur):
     RETURNS:
         None
     """
+    import matplotlib.pyplot as plt
 
     # Get Country 1 data
-    cur.execute("""
+    c1_data = cached_query(cur, """
         SELECT Music.name, KaggleData.daily_rank, Country.name FROM KaggleData 
         JOIN Music ON KaggleData.music_id = Music.id
         JOIN Country ON KaggleData.country_id = Country.id
         WHERE KaggleData.country_id = 1
     """)
 
-    c1_data = cur.fetchall()
-
     # Get Country 2 data
-    cur.execute("""
+    c2_data = cached_query(cur, """
         SELECT Music.name, KaggleData.daily_rank, Country.name FROM KaggleData 
         JOIN Music ON KaggleData.music_id = Music.id
         JOIN Country ON KaggleData.country_id = Country.id
         WHERE KaggleData.country_id = 2
     """)
 
-    c2_data = cur.fetchall()
-
     c1_dict = {}
     c2_dict = {}
 
@@ -187,11 +254,13 @@ def visualize_ranking_c1_vs_c2_common(cur):
     # Create a figure
     plt.figure(figsize=(10, 6))
 
-    # Plot the songs common to both countries
-    common_songs = set(c1_dict.keys()) & set(c2_dict.keys())
-    for song in common_songs:
-        plt.scatter(song, c1_dict[song], color='blue', label=c1_name if song == next(iter(common_songs)) else "", s=100)
-        plt.scatter(song, c2_dict[song], color='red', label=c2_name if song == next(iter(common_songs)) else "", s=100)
+    # Plot the songs common to both countries (ordered by Country 1 rank), one scatter call per country
+    common_songs = sorted(set(c1_dict.keys()) & set(c2_dict.keys()), key=lambda song: c1_dict[song])
+    positions = np.arange(len(common_songs))
+    c1_ranks = np.array([c1_dict[song] for song in common_songs])
+    c2_ranks = np.array([c2_dict[song] for song in common_songs])
+    plt.scatter(positions, c1_ranks, color='blue', label=c1_name, s=100)
+    plt.scatter(positions, c2_ranks, color='red', label=c2_name, s=100)
 
     # Plot the songs only in US
     # us_only_songs = set(us_dict.keys()) - set(ca_dict.keys())
@@ -218,13 +287,13 @@ def visualize_ranking_c1_vs_c2_common(cur):
     # Add legend for the countries
     plt.legend()
 
-    # Rotate x-axis labels for better visibility
-    plt.xticks(rotation=90)
+    # Song names on the x-axis, rotated for better visibility (thinned out for many songs)
+    set_song_xticks(common_songs)
 
 
     # Display the plot
     plt.tight_layout()
-    plt.show()
+    show_figure("ranking_c1_vs_c2_common")
     
 def visualize_spotify_popularity_vs_reddit_countries(cur):
     '''
@@ -236,13 +305,14 @@ def visualize_spotify_popularity_vs_reddit_countries(cur):
     RETURNS:
         None
     '''
+    import matplotlib.pyplot as plt
 
     # popularity = []
     # mention_count = []
 
     country_data = {}
 
-    cur.execute('''
+    rows = cached_query(cur, '''
         SELECT Country.name, Music.name, KaggleData.popularity, COUNT(Reddit.id) as mention_count
         FROM Music
         JOIN Reddit ON Music.id = Reddit.music_id
@@ -250,7 +320,6 @@ def visualize_spotify_popularity_vs_reddit_countries(cur):
         JOIN Country ON KaggleData.country_id = Country.id
         GROUP BY Country.name, Music.name
     ''')
-    rows = cur.fetchall()
     
     for row in rows:
         country_name = row[0]
@@ -271,7 +340,7 @@ def visualize_spotify_popularity_vs_reddit_countries(cur):
     plt.legend(country_data.keys())
     plt.grid()
     plt.tight_layout()
-    plt.show()
+    show_figure("spotify_popularity_vs_reddit_countries")
 
 
 def visualize_spotify_popularity_vs_reddit(cur):
@@ -284,18 +353,18 @@ def visualize_spotify_popularity_vs_reddit(cur):
     RETURNS:
         None
     '''
+    import matplotlib.pyplot as plt
 
     popularity = []
     mention_count = []
 
-    cur.execute('''
+    rows = cached_query(cur, '''
         SELECT Music.name, KaggleData.popularity, COUNT(Reddit.id) as mention_count
         FROM Music
         JOIN Reddit ON Music.id = Reddit.music_id
         JOIN KaggleData ON Music.id = KaggleData.music_id
         GROUP BY Music.name
     ''')
-    rows = cur.fetchall()
     
     for row in rows:
         popularity.append(row[1])
@@ -307,7 +376,7 @@ def visualize_spotify_popularity_vs_reddit(cur):
     plt.ylabel("Reddit Mention Count")
     plt.title("Spotify Popularity vs Reddit Mention Count")
     plt.grid()
-    plt.show()
+    show_figure("spotify_popularity_vs_reddit")
 
 
 def visualize_spotify_ranking_vs_reddit(cur):
@@ -320,18 +389,18 @@ def visualize_spotify_ranking_vs_reddit(cur):
     RETURNS:
         None
     '''
+    import matplotlib.pyplot as plt
 
     daily_ranks = []
     mentions = []
 
-    cur.execute('''
+    rows = cached_query(cur, '''
         SELECT KaggleData.daily_rank, COUNT(Reddit.id)
         FROM Music
         JOIN Reddit ON Music.id = Reddit.music_id
         JOIN KaggleData ON Music.id = KaggleData.music_id
         GROUP BY Music.id
         ''')
-    rows = cur.fetchall()
 
     for row in rows:
         daily_ranks.append(row[0])
@@ -346,7 +415,175 @@ def visualize_spotify_ranking_vs_reddit(cur):
     plt.ylabel("Reddit Mentions")
     plt.title("Spotify Daily Rank vs Reddit Mentions")
     plt.grid(True)
-    plt.show()
+    show_figure("spotify_ranking_vs_reddit")
+
+
+def visualize_country_similarity(cur, metric="spearman"):
+    '''
+    Visualizes how similar the Spotify charts of every pair of countries are as a heatmap.
+    All ranks are read with one query and compared at once (see country_similarity()).
+
+    ARGUMENTS:
+        cur: cursor object
+        metric (str): "spearman", "kendall", "jaccard", "overlap" or "rank_difference"
+    RETURNS:
+        None
+    '''
+    import matplotlib.pyplot as plt
+
+    countries, music_ids, ranks = build_rank_matrix(cached_query(cur, RANK_MATRIX_QUERY))
+    matrix = country_similarity(ranks, metrics=(metric,))[metric]
+
+    titles = {
+        "spearman": "Spearman Correlation of Common Songs",
+        "kendall": "Kendall Tau of Common Songs",
+        "jaccard": "Song Overlap (Jaccard)",
+        "overlap": "Number of Common Songs",
+        "rank_difference": "Mean Rank Difference of Common Songs",
+    }
+    color_ranges = {"spearman": (-1, 1), "kendall": (-1, 1), "jaccard": (0, 1)}
+    vmin, vmax = color_ranges.get(metric, (None, None))
+
+    size = max(6, len(countries) * 0.18)
+    plt.figure(figsize=(size + 2, size))
+    plt.imshow(np.ma.masked_invalid(matrix), cmap="coolwarm" if vmin == -1 else "viridis",
+               vmin=vmin, vmax=vmax, interpolation="nearest")
+    plt.colorbar(label=titles[metric])
+    plt.xticks(np.arange(len(countries)), countries, rotation=90, fontsize=7)
+    plt.yticks(np.arange(len(countries)), countries, fontsize=7)
+    plt.title(f"Spotify Daily Charts by Country: {titles[metric]}")
+    plt.tight_layout()
+    show_figure(f"country_similarity_{metric}")
+
+
+# Charts rendered by render_charts(): {chart name: (visualize function, tables it reads)}
+CHARTS = {
+    "ranking_c1_vs_c2_common": (visualize_ranking_c1_vs_c2_common, ["Music", "KaggleData", "Country"]),
+    "spotify_mentions_ordered": (visualize_spotify_mentions_ordered, ["Music", "KaggleData", "MentionCount"]),
+    "spotify_popularity_vs_reddit": (visualize_spotify_popularity_vs_reddit, ["Music", "KaggleData", "Reddit"]),
+    "spotify_ranking_vs_reddit": (visualize_spotify_ranking_vs_reddit, ["Music", "KaggleData", "Reddit"]),
+    "spotify_popularity_vs_reddit_countries": (visualize_spotify_popularity_vs_reddit_countries,
+                                               ["Music", "KaggleData", "Country", "Reddit"]),
+    "top10_reddit_mentions": (visualize_top10_reddit_mentions, ["Music", "MentionCount"]),
+    "country_similarity_spearman": (visualize_country_similarity, ["KaggleData", "Country"]),
+}
+
+
+def table_fingerprints(cur):
+    '''
+    Returns a cheap version stamp of every table the charts read: (row count, largest rowid, schema
+    version). Music, Country and KaggleData only get new rows (INSERT OR IGNORE), so any new data
+    changes the stamp. Reddit rows can also be replaced: create_update_reddit_db() deletes a legacy
+    row and inserts the same post again under its post id, which can leave the count and the largest
+    rowid unchanged, so the sums of its rowids and song ids are included as well. MentionCount is
+    updated in place by triggers, so its total count is included.
+
+    ARGUMENTS:
+        cur: cursor object
+    RETURNS:
+        fingerprints (dict): {table name: [values]}
+    '''
+    cur.execute("PRAGMA user_version")
+    schema_version = cur.fetchone()[0]
+
+    fingerprints = {}
+    for table in sorted(set(table for _, tables in CHARTS.values() for table in tables)):
+        if table == "MentionCount":
+            cur.execute("SELECT COUNT(*), MAX(rowid), COALESCE(SUM(count), 0) FROM MentionCount")
+        elif table == "Reddit":
+            cur.execute("SELECT COUNT(*), MAX(rowid), TOTAL(rowid), TOTAL(music_id) FROM Reddit")
+        else:
+            cur.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}")
+        fingerprints[table] = list(cur.fetchone()) + [schema_version]
+    return fingerprints
+
+
+def render_chart(db_name, chart_name, output_dir, formats):
+    '''
+    Renders one chart to files with the Agg backend (runs in a worker process of render_charts()).
+
+    ARGUMENTS:
+        db_name: database filename
+        chart_name (str): key of CHARTS
+        output_dir (str): directory for the image files
+        formats (tuple): image formats, e.g. ("png", "svg")
+    RETURNS:
+        chart_name (str)
+    '''
+    import matplotlib
+    matplotlib.use("Agg")
+    render_settings["output_dir"] = output_dir
+    render_settings["formats"] = tuple(formats)
+
+    cur, conn = setup_db(db_name, read_only=True)
+    try:
+        visualize_function = CHARTS[chart_name][0]
+        visualize_function(cur)
+    finally:
+        conn.close()
+    return chart_name
+
+
+def render_charts(db_name="final.db", output_dir="charts", formats=("png", "svg"), max_workers=None, force=False,
+                  failed=None):
+    '''
+    Headless rendering of every chart to image files, in parallel across a process pool. A chart is
+    skipped when the tables it reads have not changed since it was last rendered (fingerprints are
+    stored in <output_dir>/manifest.json) and all of its files exist, unless force=True.
+
+    ARGUMENTS:
+        db_name: database filename
+        output_dir (str): directory for the image files (relative to this file's directory)
+        formats (tuple): image formats, e.g. ("png", "svg")
+        max_workers (int): number of worker processes (default: one per CPU)
+        force (bool): render every chart even if its data did not change
+        failed (dict): optional, filled with {chart name: error message} for the charts that raised; they are
+            left out of the manifest so the next run retries them
+    RETURNS:
+        rendered (list): names of the charts that were rendered
+    '''
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    cur, conn = setup_db(db_name, read_only=True)
+    fingerprints = table_fingerprints(cur)
+    conn.close()
+
+    pending = {}
+    for chart_name, (_, tables) in CHARTS.items():
+        chart_version = {"tables": {table: fingerprints[table] for table in tables}, "formats": sorted(formats)}
+        files_exist = all(os.path.exists(os.path.join(output_dir, f"{chart_name}.{file_format}"))
+                          for file_format in formats)
+        if force or manifest.get(chart_name) != chart_version or not files_exist:
+            pending[chart_name] = chart_version
+
+    rendered = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(render_chart, db_name, chart_name, output_dir, tuple(formats))
+                       for chart_name in pending]
+            for chart_name, future in zip(pending, futures):
+                # One failing chart must not lose the others, so errors are collected per chart
+                try:
+                    future.result()
+                except Exception as e:
+                    manifest.pop(chart_name, None)
+                    if failed is not None:
+                        failed[chart_name] = f"{type(e).__name__}: {e}"
+                    continue
+                manifest[chart_name] = pending[chart_name]
+                rendered.append(chart_name)
+
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    return rendered
 
 
 def main():
@@ -358,10 +595,7 @@ def main():
 
     # Set up database
     db_name = "final.db"
-    cur, conn = setup_db(db_name)
-
-    # get Reddit post counts for each song
-    count_reddit_posts(cur)
+    cur, conn = setup_db(db_name, read_only=True)
 
     filename = "reddit_post_counts.csv"
 
@@ -373,20 +607,22 @@ def main():
     5. Option 5: Spotify Popularity (country 1 and country 2) vs. Reddit Mention Frequency
     6. Option 6: Top 10 Songs by Reddit Mentions
     8. Option 7: Everything
-    8. Exit\n'''
+    8. Exit
+    9. Export Reddit mention counts to reddit_post_counts.csv
+    10. Spotify Daily Rank similarity of every pair of countries (heatmap)\n'''
     
     print(options)
 
     option = 0
 
     while option != 8: 
-        option = int(input("\nPlease select an option (1-8): "))
+        option = int(input("\nPlease select an option (1-10): "))
         if option == 1:
             print("\nOption 1: Spotify Daily Rank - Country 1 vs. Country 2 (common songs)")
             visualize_ranking_c1_vs_c2_common(cur)
         elif option == 2:
             print("\nOption 2: Spotify Daily Rank (ascending) vs. Reddit Mention Frequency (bar)")
-            visualize_spotify_mentions_ordered(cur, filename)
+            visualize_spotify_mentions_ordered(cur)
         elif option == 3:
             print("\nOption 3: Spotify Popularity vs. Reddit Mention Frequency")
             visualize_spotify_popularity_vs_reddit(cur)
@@ -398,17 +634,24 @@ def main():
             visualize_spotify_popularity_vs_reddit_countries(cur)
         elif option == 6:
             print("\nOption 6: Top 10 Songs by Reddit Mentions")
-            visualize_top10_reddit_mentions(filename)
+            visualize_top10_reddit_mentions(cur)
         elif option == 7:
             print("Everything")
             visualize_ranking_c1_vs_c2_common(cur)
-            visualize_spotify_mentions_ordered(cur, filename)
+            visualize_spotify_mentions_ordered(cur)
             visualize_spotify_popularity_vs_reddit(cur)
             visualize_spotify_ranking_vs_reddit(cur)
             visualize_spotify_popularity_vs_reddit_countries(cur)
-            visualize_top10_reddit_mentions(filename)
+            visualize_top10_reddit_mentions(cur)
+            visualize_country_similarity(cur)
         elif option == 8:
             print("Exiting the program...")
+        elif option == 9:
+            count_reddit_posts(cur, filename)
+            print(f"\nReddit mention counts written to {filename}")
+        elif option == 10:
+            print("\nOption 10: Spotify Daily Rank similarity of every pair of countries (heatmap)")
+            visualize_country_similarity(cur)
         else:
             print("\nINVALID OPTION\n")    
 
@@ -416,4 +659,22 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "render":
+        # Headless mode: python FinalProject_visualize.py render [--out charts] [--formats png svg] [--force]
+        parser = argparse.ArgumentParser(description="Render every chart to image files without a display")
+        parser.add_argument("command", choices=["render"])
+        parser.add_argument("--db", default="final.db", help="database filename")
+        parser.add_argument("--out", default="charts", help="output directory")
+        parser.add_argument("--formats", nargs="+", default=["png", "svg"], help="image formats")
+        parser.add_argument("--workers", type=int, default=None, help="worker processes")
+        parser.add_argument("--force", action="store_true", help="render charts whose data did not change")
+        args = parser.parse_args()
+        failed = {}
+        rendered = render_charts(args.db, args.out, args.formats, args.workers, args.force, failed)
+        print(f"Rendered {len(rendered)} of {len(CHARTS)} charts: {', '.join(rendered) or ('(none)' if failed else '(all up to date)')}")
+        if failed:
+            for chart_name, error in failed.items():
+                print(f"Failed to render {chart_name}: {error}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        main()
\ No newline at end of file